@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Общий конвейер анализаторов активов: загрузка -> нормализация -> снимок -> отбор -> результат
+Каждый этап замеряет время и число элементов на входе и выходе.
+Этап может вернуть генератор: тогда записи идут потоком в следующий этап без промежуточного списка
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterator as IteratorABC
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from config import SNAPSHOT_TTL, SNAPSHOT_MAX_STALE
+from market_snapshot import FieldSpec, MarketSnapshot
+from recommendation_memo import get_recommendation_memo
+from scoring_rules import CompiledScorer, get_scoring_rules
+from single_flight import get_single_flight
+from snapshot_refresher import SnapshotRefresher, get_refresher
+from tiered_selection import STRICT, Tier, TieredSelection, first_tier, ordered, select_tiered
+
+
+class Stage(NamedTuple):
+    name: str
+    run: Callable[[Any], Any]
+    # Число элементов результата, если len() к нему неприменим
+    count: Optional[Callable[[Any], int]] = None
+
+
+class StageStats:
+    __slots__ = ('name', 'seconds', 'items_in', 'items_out', 'streamed')
+    
+    def __init__(self, name: str, items_in: Optional[int] = None):
+        self.name = name
+        self.seconds = 0.0
+        self.items_in = items_in
+        self.items_out: Optional[int] = None
+        self.streamed = False
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {'stage': self.name, 'ms': round(self.seconds * 1000, 2),
+                'items_in': self.items_in, 'items_out': self.items_out}
+
+
+class _TimedIterator:
+    """Считает элементы потокового этапа и время, проведенное в нем"""
+    
+    def __init__(self, iterator: Iterator[Any], stats: StageStats):
+        self._iterator = iterator
+        self._stats = stats
+        stats.items_out = 0
+        stats.streamed = True
+    
+    def __iter__(self) -> '_TimedIterator':
+        return self
+    
+    def __next__(self) -> Any:
+        started = time.perf_counter()
+        try:
+            item = next(self._iterator)
+        finally:
+            self._stats.seconds += time.perf_counter() - started
+        self._stats.items_out += 1
+        return item
+
+
+class PipelineRun:
+    """Один проход конвейера с замерами по этапам"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.stages: List[StageStats] = []
+    
+    def run(self, stages: Sequence[Stage], data: Any = None) -> Any:
+        for stage in stages:
+            previous = self.stages[-1] if self.stages else None
+            if previous is not None:
+                items_in = previous.items_out
+            else:
+                items_in = len(data) if hasattr(data, '__len__') else None
+            stats = StageStats(stage.name, items_in)
+            self.stages.append(stats)
+            
+            started = time.perf_counter()
+            data = stage.run(data)
+            stats.seconds += time.perf_counter() - started
+            
+            if isinstance(data, IteratorABC):
+                data = _TimedIterator(data, stats)
+            elif stage.count is not None:
+                stats.items_out = stage.count(data)
+            elif hasattr(data, '__len__'):
+                stats.items_out = len(data)
+        return data
+    
+    def report(self) -> List[Dict[str, Any]]:
+        """Итоги прохода: собственное время этапов, печать и сохранение для /health"""
+        # Время потокового этапа включает время предыдущих этапов, из которых он читал
+        for previous, stats in zip(self.stages, self.stages[1:]):
+            if previous.streamed:
+                stats.seconds = max(0.0, stats.seconds - previous.seconds)
+                stats.items_in = previous.items_out
+        
+        summary = [stats.as_dict() for stats in self.stages]
+        print(f"⏱ {self.name}: " + ", ".join(
+            f"{s.name} {s.seconds * 1000:.1f}мс ({s.items_in if s.items_in is not None else '-'}→"
+            f"{s.items_out if s.items_out is not None else '-'})" for s in self.stages))
+        with _last_runs_lock:
+            _last_runs[self.name] = summary
+        return summary
+
+
+class AssetAnalyzer(ABC):
+    """
+    Базовый анализатор: подклассы задают загрузку записей у провайдера (и кеш снимков self.cache),
+    колонки и уровни отбора, а кеширование снимка, оценка, отбор топ-3, мемоизация и замеры общие
+    """
+    asset_class = ''
+    fields: Sequence[FieldSpec] = ()
+    universe_size = 0
+    # Ключ снимка в кеше: "{snapshot_prefix}_snapshot_{limit}"
+    snapshot_prefix = ''
+    # Период фонового обновления снимка, сек
+    refresh_interval = 0
+    top_k = 3
+    # Подписи для логов: "рекомендаций {title}", "Получено N {items_label}", "Найдено N подходящих {suitable_label}"
+    title = ''
+    items_label = 'активов'
+    suitable_label = 'активов'
+    
+    def __init__(self):
+        # Готовые топ-3 по версии снимка
+        self.memo = get_recommendation_memo()
+        # Правила оценки, перечитываются при изменении файла
+        self.rules = get_scoring_rules()
+    
+    @abstractmethod
+    def fetch_universe(self, limit: int) -> List[Dict[str, Any]]:
+        """Загружает записи у провайдеров (пустой список, если все недоступны)"""
+    
+    @abstractmethod
+    def selection_tiers(self, snapshot: MarketSnapshot) -> List[Tier]:
+        """Маски уровней отбора по колонкам снимка"""
+    
+    def fallback_snapshot(self) -> List[Dict[str, Any]]:
+        """Записи на случай, когда снимка нет и провайдеры недоступны"""
+        return []
+    
+    def get_snapshot(self, limit: Optional[int] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Снимок рынка с версией (0 — резервные данные).
+        Свежий снимок берется из кеша; устаревший отдается сразу, а обновление идет в фоне
+        """
+        limit = limit or self.universe_size
+        cache_key = self._snapshot_key(limit)
+        version, cached = self.cache.read_versioned(cache_key, SNAPSHOT_TTL)
+        if cached:
+            return version, cached
+        
+        version, stale = self.cache.read_versioned(cache_key, SNAPSHOT_MAX_STALE)
+        if stale:
+            get_refresher().trigger(cache_key, lambda: self.refresh_snapshot(limit))
+            return version, stale
+        
+        records = self.fetch_universe(limit)
+        if records:
+            return self.cache.write(cache_key, records), records
+        return 0, self.fallback_snapshot()
+    
+    def _snapshot_key(self, limit: int) -> str:
+        return f"{self.snapshot_prefix}_snapshot_{limit}"
+    
+    def refresh_snapshot(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Загружает записи у провайдеров и сохраняет снимок"""
+        limit = limit or self.universe_size
+        records = self.fetch_universe(limit)
+        if records:
+            self.cache.write(self._snapshot_key(limit), records)
+        return records
+    
+    def schedule_refresh(self, refresher: Optional[SnapshotRefresher] = None) -> None:
+        """Регистрирует фоновое обновление снимка раньше истечения его TTL"""
+        refresher = refresher or get_refresher()
+        refresher.register(self._snapshot_key(self.universe_size), self.refresh_snapshot,
+                           self.refresh_interval)
+    
+    def memo_params(self) -> Tuple[Any, ...]:
+        """Параметры, от которых зависит результат при той же версии снимка"""
+        return (self.universe_size,)
+    
+    def iter_records(self, records: Iterable[Any]) -> Iterator[Dict[str, Any]]:
+        """Нормализация: пропускает записи, которые не похожи на строку провайдера"""
+        for record in records or ():
+            if isinstance(record, dict):
+                yield record
+    
+    def build_snapshot(self, records: Iterable[Dict[str, Any]], version: int = 0) -> MarketSnapshot:
+        """Колоночный снимок из записей провайдера"""
+        return MarketSnapshot.from_records(records or [], self.fields, version)
+    
+    def filter_snapshot(self, snapshot: MarketSnapshot) -> List[int]:
+        """Индексы подходящих активов (первый набравший кандидатов уровень с оценкой)"""
+        tiers = [tier for tier in self.selection_tiers(snapshot) if tier.scored]
+        tier = first_tier(tiers)
+        if len(tiers) > 1 and (tier is None or tier.name != tiers[0].name):
+            print(f"Строгие критерии дали {int(tiers[0].mask.sum())} {self.suitable_label}, ослабляем...")
+        return ordered(tier).tolist() if tier is not None else []
+    
+    def filter_records(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Подходящие записи в виде словарей"""
+        snapshot = self.build_snapshot(records)
+        return snapshot.rows(self.filter_snapshot(snapshot))
+    
+    def select(self, snapshot: MarketSnapshot, scorer: CompiledScorer) -> TieredSelection:
+        """Один проход по уровням: оценки считаются только для кандидатов выбранного уровня"""
+        selection = select_tiered(self.selection_tiers(snapshot), self.top_k,
+                                  lambda indices: scorer.score_snapshot(snapshot, indices))
+        if len(selection.counts) > 1 and selection.tier != STRICT:
+            print(f"Строгие критерии дали {selection.counts[STRICT]} {self.suitable_label}, ослабляем...")
+        return selection
+    
+    def materialize(self, snapshot: MarketSnapshot, selection: TieredSelection) -> List[Dict[str, Any]]:
+        """Словари собираются только для выбранных строк"""
+        selected = selection.selected.tolist()
+        return snapshot.rows(selected, dict(zip(selected, selection.scores.tolist())))
+    
+    def pipeline_stages(self, version: int, scorer: CompiledScorer) -> List[Stage]:
+        """Этапы от записей снимка до топ-k; подклассы могут добавить свои"""
+        return [
+            Stage('normalize', self.iter_records),
+            Stage('snapshot', lambda records: self.build_snapshot(records, version)),
+            Stage('select', lambda snapshot: (snapshot, self.select(snapshot, scorer)),
+                  count=lambda result: len(result[1].candidates)),
+            Stage('materialize', lambda result: self.materialize(*result)),
+        ]
+    
+    def calculate_investment_score(self, asset: Dict[str, Any]) -> float:
+        """Рассчитывает оценку привлекательности по правилам из scoring_rules.json"""
+        return self.rules.scorer(self.asset_class).score(asset)
+    
+    def get_top_3_recommendations(self) -> List[Dict[str, Any]]:
+        """Возвращает топ-3 рекомендации для покупки"""
+        return self.get_versioned_recommendations()[1]
+    
+    def recommendations_key(self) -> Tuple[Any, ...]:
+        """Ключ для объединения одновременных запросов рекомендаций"""
+        return (self.asset_class,) + self.memo_params()
+    
+    def get_versioned_recommendations(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """Топ-3 вместе с версией снимка, по которому они посчитаны"""
+        # Одновременные запросы с теми же параметрами ждут один расчет
+        return get_single_flight().do(self.recommendations_key(), self.compute_versioned_recommendations)
+    
+    def compute_versioned_recommendations(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """Расчет топ-3 без объединения запросов (вызывается ведущим запросом)"""
+        print(f"🚀 Начинаем получение рекомендаций{self.title}...")
+        run = PipelineRun(self.asset_class)
+        version, records = run.run([Stage('fetch', lambda _: self.get_snapshot(self.universe_size),
+                                          count=lambda result: len(result[1]))])
+        
+        # Правила берем один раз: ключ и расчет относятся к одной версии правил
+        scorer = self.rules.scorer(self.asset_class)
+        # Для той же версии снимка, фильтров и правил результат уже посчитан
+        memo_key = (self.asset_class,) + self.memo_params() + (scorer.version,)
+        memoized = self.memo.get(memo_key, version)
+        if memoized is not None:
+            print(f"♻️ Рекомендации из кеша (снимок v{version})")
+            run.report()
+            return version, memoized
+        
+        result = self._rank_recommendations(records, version, scorer, run)
+        self.memo.put(memo_key, version, result)
+        return version, result
+    
+    def _rank_recommendations(self, records: List[Dict[str, Any]], version: int = 0,
+                              scorer: Optional[CompiledScorer] = None,
+                              run: Optional[PipelineRun] = None) -> List[Dict[str, Any]]:
+        """Фильтрует, оценивает и выбирает топ-3 из снимка рынка"""
+        print(f"📊 Получено {len(records) if records else 0} {self.items_label}")
+        scorer = scorer or self.rules.scorer(self.asset_class)
+        run = run or PipelineRun(self.asset_class)
+        
+        result = run.run(self.pipeline_stages(version, scorer), records)
+        found = sum(stats.items_out or 0 for stats in run.stages if stats.name == 'select')
+        print(f"✅ Найдено {found} подходящих {self.suitable_label}")
+        print(f"🏆 Возвращаем {len(result)} рекомендаций")
+        run.report()
+        return result
+
+
+_last_runs: Dict[str, List[Dict[str, Any]]] = {}
+_last_runs_lock = threading.Lock()
+
+
+def pipeline_stats() -> Dict[str, List[Dict[str, Any]]]:
+    """Замеры последнего прохода конвейера по каждому классу активов"""
+    with _last_runs_lock:
+        return dict(_last_runs)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Планировщик ежедневных задач на asyncio
+Задачи хранятся в куче по времени следующего запуска, цикл спит ровно до ближайшего срока и
+запускает задачу в текущем event loop. Время считается в часовом поясе задачи (TIMEZONE),
+последний запуск сохраняется в SQLite: запуск, пропущенный из-за рестарта, выполняется при старте
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import pytz
+from config import SNAPSHOT_DB_PATH, SCHEDULER_MISFIRE_GRACE, TIMEZONE
+
+
+def _daily_run_on(at: str, tz: pytz.BaseTzInfo, day: date) -> float:
+    """Момент at (ЧЧ:ММ) в поясе tz в конкретную местную дату"""
+    hour, minute = (int(part) for part in at.split(':'))
+    # localize учитывает переход на летнее время для конкретной даты
+    return tz.localize(datetime(day.year, day.month, day.day, hour, minute)).timestamp()
+
+
+def next_daily_run(at: str, tz: pytz.BaseTzInfo, after: float) -> float:
+    """Ближайший момент строго после after, когда в поясе tz наступает время at (ЧЧ:ММ)"""
+    day = datetime.fromtimestamp(after, tz).date()
+    while True:
+        candidate = _daily_run_on(at, tz, day)
+        if candidate > after:
+            return candidate
+        day += timedelta(days=1)
+
+
+def previous_daily_run(at: str, tz: pytz.BaseTzInfo, now: float) -> float:
+    """Последний плановый момент не позже now"""
+    # Шагаем по местным датам, а не по 86400 с: в дни перехода на летнее время сутки короче
+    day = datetime.fromtimestamp(now, tz).date()
+    candidate = _daily_run_on(at, tz, day)
+    if candidate > now:
+        candidate = _daily_run_on(at, tz, day - timedelta(days=1))
+    return candidate
+
+
+class DailyJob:
+    def __init__(self, name: str, at: str, callback: Callable[[float], Awaitable[None]], timezone: str = TIMEZONE):
+        self.name = name
+        self.at = at
+        self.callback = callback
+        self.tz = pytz.timezone(timezone)
+        self.task: Optional[asyncio.Task] = None
+    
+    def next_run(self, after: float) -> float:
+        return next_daily_run(self.at, self.tz, after)
+
+
+class AsyncScheduler:
+    def __init__(self, db_path: str = SNAPSHOT_DB_PATH, misfire_grace: float = SCHEDULER_MISFIRE_GRACE):
+        self.db_path = db_path
+        self.misfire_grace = misfire_grace
+        self.jobs: Dict[str, DailyJob] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        # Задачи, добавленные, но еще не поставленные в кучу (нужно прочитать последний запуск)
+        self._unscheduled: List[str] = []
+        self._local = threading.local()
+    
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Отдельное соединение на поток: обращения к SQLite идут из потоков asyncio.to_thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            try:
+                os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+                conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS scheduler_runs (job TEXT PRIMARY KEY, last_run REAL NOT NULL)'
+                )
+                self._local.conn = conn
+            except sqlite3.Error as e:
+                print(f"Хранилище запусков недоступно, пропущенные запуски не восстанавливаются: {e}")
+                return None
+        return conn
+    
+    def last_run(self, name: str) -> Optional[float]:
+        conn = self._connect()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute('SELECT last_run FROM scheduler_runs WHERE job = ?', (name,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Не удалось прочитать последний запуск {name}: {e}")
+            return None
+        return row[0] if row else None
+    
+    def _record_run(self, name: str, scheduled: float) -> None:
+        conn = self._connect()
+        if conn is None:
+            return
+        try:
+            conn.execute('INSERT OR REPLACE INTO scheduler_runs (job, last_run) VALUES (?, ?)', (name, scheduled))
+        except sqlite3.Error as e:
+            print(f"Не удалось сохранить запуск {name}: {e}")
+    
+    def add_daily(self, name: str, at: str, callback: Callable[[float], Awaitable[None]],
+                  timezone: str = TIMEZONE) -> DailyJob:
+        """
+        Добавляет ежедневную задачу; в расписание она попадает в run()
+        callback получает плановое время запуска (timestamp): у догоняющего запуска оно то же, что у пропущенного
+        """
+        job = DailyJob(name, at, callback, timezone)
+        self.jobs[name] = job
+        self._unscheduled.append(name)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+    
+    async def _schedule(self, job: DailyJob) -> None:
+        """Ставит задачу в кучу; пропущенный (в пределах окна) запуск ставится на сейчас"""
+        now = time.time()
+        due = job.next_run(now)
+        
+        last = await asyncio.to_thread(self.last_run, job.name)
+        missed = previous_daily_run(job.at, job.tz, now)
+        if last is None:
+            # Первый запуск: отмечаем последний плановый момент, чтобы не догонять историю
+            await asyncio.to_thread(self._record_run, job.name, missed)
+        elif last < missed and now - missed <= self.misfire_grace:
+            print(f"⏰ Пропущенный запуск {job.name} ({datetime.fromtimestamp(missed, job.tz):%d.%m %H:%M}) выполняется сейчас")
+            due = missed
+        
+        heapq.heappush(self._heap, (due, next(self._counter), job.name))
+    
+    def _start(self, job: DailyJob, scheduled: float) -> None:
+        if job.task is not None and not job.task.done():
+            print(f"⚠️ {job.name}: предыдущий запуск еще выполняется, пропускаем")
+            return
+        job.task = asyncio.get_running_loop().create_task(self._execute(job, scheduled))
+    
+    async def _execute(self, job: DailyJob, scheduled: float) -> None:
+        try:
+            await job.callback(scheduled)
+        except Exception as e:
+            print(f"❌ Ошибка задачи {job.name}: {e}")
+            return
+        # Отмечаем только завершенный запуск: прерванный рестартом выполнится повторно
+        await asyncio.to_thread(self._record_run, job.name, scheduled)
+    
+    async def run(self) -> None:
+        """Спит до ближайшего срока и запускает задачи; работает до отмены"""
+        self._wakeup = asyncio.Event()
+        while True:
+            while self._unscheduled:
+                await self._schedule(self.jobs[self._unscheduled.pop(0)])
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, name = heapq.heappop(self._heap)
+                job = self.jobs[name]
+                self._start(job, due)
+                heapq.heappush(self._heap, (job.next_run(max(due, now)), next(self._counter), name))
+            
+            timeout = self._heap[0][0] - now if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    
+    def next_runs(self) -> Dict[str, str]:
+        return {name: datetime.fromtimestamp(due, self.jobs[name].tz).isoformat()
+                for due, _, name in sorted(self._heap)}
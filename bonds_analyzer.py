@@ -3,23 +3,54 @@
 Модуль для анализа облигаций
 """
 
-import requests
-import json
-import time
-import os
-import hashlib
 from typing import List, Dict, Any
 from datetime import datetime
 from config import DAILY_BUDGET
+from asset_pipeline import AssetAnalyzer
+from market_cache import get_market_cache
+from market_snapshot import MarketSnapshot, FLOAT, TEXT
+from scoring_engine import column
+from tiered_selection import Tier, STRICT
 
-class BondsAnalyzer:
+# Колонки снимка облигаций
+BOND_FIELDS = [
+    ('symbol', lambda bond: bond.get('symbol'), TEXT),
+    ('name', lambda bond: bond.get('name'), TEXT),
+    ('current_price', lambda bond: bond.get('current_price'), FLOAT),
+    ('yield', lambda bond: bond.get('yield'), FLOAT),
+    ('price_change_24h', lambda bond: bond.get('price_change_24h'), FLOAT),
+    ('maturity', lambda bond: bond.get('maturity'), TEXT),
+    ('type', lambda bond: bond.get('type'), TEXT),
+    ('rating', lambda bond: bond.get('rating'), TEXT),
+    ('volume_24h', lambda bond: bond.get('volume_24h'), FLOAT),
+    ('market_cap', lambda bond: bond.get('market_cap'), FLOAT),
+]
+
+class BondsAnalyzer(AssetAnalyzer):
+    asset_class = 'bonds'
+    fields = BOND_FIELDS
+    universe_size = 20
+    title = ' по облигациям'
+    items_label = 'облигаций'
+    suitable_label = 'облигаций'
+    snapshot_prefix = 'bonds'
+    
     def __init__(self):
+        super().__init__()
         # Используем открытые источники данных об облигациях
         self.base_url = "https://www.treasury.gov"
+        # Снимки облигаций живут в том же хранилище, что и у остальных анализаторов
+        self.cache = get_market_cache('bonds')
         
     def get_top_bonds(self, limit: int = 50) -> List[Dict[str, Any]]:
         """
         Получает топ облигаций
+        """
+        return self.get_snapshot(limit)[1]
+    
+    def fetch_universe(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Записи облигаций
         Используем список популярных облигаций
         """
         # Популярные облигации (US Treasury, корпоративные)
@@ -91,105 +122,13 @@ class BondsAnalyzer:
     
     def filter_suitable_bonds(self, bonds: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Фильтрует облигации по критериям"""
-        suitable = []
-        
-        for bond in bonds:
-            try:
-                price = bond.get('current_price', 0)
-                yield_rate = bond.get('yield', 0)
-                volume = bond.get('volume_24h', 0)
-                
-                # Критерии: доступная цена, хорошая доходность, достаточная ликвидность
-                if (price <= 100.0 and  # Облигации обычно торгуются около номинала
-                    price > 50.0 and  # Не слишком дешево (риск дефолта)
-                    yield_rate >= 3.0 and  # Минимальная доходность
-                    volume >= 100000000):  # Достаточная ликвидность
-                    
-                    suitable.append(bond)
-            except Exception:
-                continue
-        
-        return suitable
-    
-    def calculate_investment_score(self, bond: Dict[str, Any]) -> float:
-        """Рассчитывает оценку привлекательности"""
-        score = 0.0
-        
-        # Оценка по доходности (чем выше, тем лучше)
-        yield_rate = bond.get('yield', 0)
-        if yield_rate >= 5.0:
-            yield_score = 10
-        elif yield_rate >= 4.0:
-            yield_score = 8
-        elif yield_rate >= 3.0:
-            yield_score = 6
-        else:
-            yield_score = 3
-        score += yield_score * 0.4
-        
-        # Оценка по рейтингу (чем выше, тем безопаснее)
-        rating = bond.get('rating', '')
-        if rating == 'AAA':
-            rating_score = 10
-        elif rating in ['AA', 'AA+', 'AA-']:
-            rating_score = 9
-        elif rating in ['A', 'A+', 'A-']:
-            rating_score = 8
-        elif rating in ['BBB', 'BBB+', 'BBB-']:
-            rating_score = 6
-        else:
-            rating_score = 4
-        score += rating_score * 0.3
-        
-        # Оценка по ликвидности
-        volume = bond.get('volume_24h', 0)
-        if volume >= 500000000:
-            volume_score = 10
-        elif volume >= 200000000:
-            volume_score = 8
-        elif volume >= 100000000:
-            volume_score = 6
-        else:
-            volume_score = 4
-        score += volume_score * 0.2
-        
-        # Оценка по цене (близко к номиналу - лучше)
-        price = bond.get('current_price', 100)
-        price_diff = abs(price - 100)
-        if price_diff <= 1:
-            price_score = 10
-        elif price_diff <= 3:
-            price_score = 8
-        elif price_diff <= 5:
-            price_score = 6
-        else:
-            price_score = 4
-        score += price_score * 0.1
-        
-        return score
+        return self.filter_records(bonds)
     
-    def get_top_3_recommendations(self) -> List[Dict[str, Any]]:
-        """Получает топ-3 рекомендации по облигациям"""
-        print("🚀 Начинаем получение рекомендаций по облигациям...")
-        
-        bonds = self.get_top_bonds(limit=20)
-        print(f"📊 Получено {len(bonds) if bonds else 0} облигаций")
-        
-        suitable = self.filter_suitable_bonds(bonds)
-        print(f"✅ Найдено {len(suitable) if suitable else 0} подходящих облигаций")
-        
-        if not suitable:
-            return []
-        
-        # Рассчитываем оценки
-        for bond in suitable:
-            bond['investment_score'] = self.calculate_investment_score(bond)
-        
-        # Сортируем по оценке
-        suitable.sort(key=lambda x: x.get('investment_score', 0), reverse=True)
-        
-        # Возвращаем топ-3
-        result = suitable[:3]
-        print(f"🏆 Возвращаем {len(result)} рекомендаций")
-        return result
-
+    def selection_tiers(self, snapshot: MarketSnapshot) -> List[Tier]:
+        """Единственный уровень отбора облигаций"""
+        price = column(snapshot, 'current_price')
+        yield_rate = column(snapshot, 'yield')
+        volume = column(snapshot, 'volume_24h')
+        # Критерии: цена около номинала (не слишком дешево — риск дефолта),
+        # минимальная доходность 3% и достаточная ликвидность
+        return [Tier(STRICT, (price > 50.0) & (price <= 100.0) & (yield_rate >= 3.0) & (volume >= 100000000))]
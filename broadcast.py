@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Подписчики и рассылка ежедневных рекомендаций
+Реестр подписчиков и отметки доставки хранятся в SQLite (общее хранилище снимков).
+Сообщение готовится один раз и рассылается пулом отправителей под общим лимитом скорости
+и лимитом на чат; для каждого чата по id рассылки отмечается число отправленных частей,
+поэтому после рестарта рассылка продолжается с места остановки, а не начинается заново.
+Обращения к SQLite выполняются в потоках, чтобы занятая база не останавливала event loop
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, tzinfo
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+from telegram import Bot, Update
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError, TimedOut
+from telegram.ext import Application, CommandHandler, ContextTypes
+from config import (SNAPSHOT_DB_PATH, CHAT_ID, BROADCAST_CONCURRENCY, BROADCAST_RATE,
+                    BROADCAST_CHAT_INTERVAL, BROADCAST_MAX_ATTEMPTS)
+
+# Отметки доставки пишутся пачками: при падении повторно уйдет не больше пачки
+CHECKPOINT_BATCH = 50
+CHECKPOINT_INTERVAL = 1.0
+# Сколько хранить отметки старых рассылок, сек
+DELIVERY_RETENTION = 7 * 86400
+
+DELIVERED = 'delivered'
+DEACTIVATED = 'deactivated'
+FAILED = 'failed'
+# Часть сообщения ушла, остальные еще нет
+PARTIAL = 'partial'
+# Telegram не ответил вовремя: сообщение могло дойти, повторно не отправляем
+UNCERTAIN = 'uncertain'
+# Статусы, после которых чату в этой рассылке больше ничего не отправляется
+FINISHED = (DELIVERED, DEACTIVATED, UNCERTAIN)
+
+
+class SubscriberRegistry:
+    def __init__(self, db_path: str = SNAPSHOT_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Отдельное соединение на поток; схема создается при первом обращении"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS subscribers ('
+                'chat_id INTEGER PRIMARY KEY, active INTEGER NOT NULL, updated_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS broadcast_deliveries ('
+                'broadcast_id TEXT NOT NULL, chat_id INTEGER NOT NULL, status TEXT NOT NULL, '
+                'parts_sent INTEGER NOT NULL DEFAULT 0, delivered_at REAL NOT NULL, '
+                'PRIMARY KEY (broadcast_id, chat_id))'
+            )
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(broadcast_deliveries)')}
+            if 'parts_sent' not in columns:
+                conn.execute('ALTER TABLE broadcast_deliveries ADD COLUMN parts_sent INTEGER NOT NULL DEFAULT 0')
+            self._local.conn = conn
+        return conn
+    
+    def seed(self, chat_id) -> None:
+        """Добавляет чат из конфигурации, не меняя статус уже известного (отписку не отменяет)"""
+        if not chat_id:
+            return
+        if not str(chat_id).strip().lstrip('-').isdigit():
+            # Имя канала (@channel) — не id чата, реестр хранит только числовые id
+            print(f"⚠️ CHAT_ID {chat_id!r} не числовой, в реестр подписчиков не добавлен")
+            return
+        self._connect().execute(
+            'INSERT OR IGNORE INTO subscribers (chat_id, active, updated_at) VALUES (?, 1, ?)',
+            (int(chat_id), time.time())
+        )
+    
+    def set_active(self, chat_id: int, active: bool) -> None:
+        self._connect().execute(
+            'INSERT OR REPLACE INTO subscribers (chat_id, active, updated_at) VALUES (?, ?, ?)',
+            (int(chat_id), int(active), time.time())
+        )
+    
+    def subscribe(self, chat_id: int) -> None:
+        self.set_active(chat_id, True)
+    
+    def unsubscribe(self, chat_id: int) -> None:
+        self.set_active(chat_id, False)
+    
+    def is_active(self, chat_id: int) -> bool:
+        row = self._connect().execute('SELECT active FROM subscribers WHERE chat_id = ?', (int(chat_id),)).fetchone()
+        return bool(row and row[0])
+    
+    def active_chat_ids(self) -> List[int]:
+        return [row[0] for row in self._connect().execute(
+            'SELECT chat_id FROM subscribers WHERE active = 1 ORDER BY chat_id')]
+    
+    def progress(self, broadcast_id: str) -> Dict[int, Tuple[str, int]]:
+        """Состояние рассылки по чатам: chat_id -> (статус, число отправленных частей)"""
+        return {row[0]: (row[1], row[2]) for row in self._connect().execute(
+            'SELECT chat_id, status, parts_sent FROM broadcast_deliveries WHERE broadcast_id = ?',
+            (broadcast_id,))}
+    
+    def record(self, broadcast_id: str, results: List[tuple]) -> None:
+        """Сохраняет пачку результатов (chat_id, status, parts_sent) и отключает недоступных подписчиков"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO broadcast_deliveries '
+                '(broadcast_id, chat_id, status, parts_sent, delivered_at) VALUES (?, ?, ?, ?, ?)',
+                [(broadcast_id, chat_id, status, parts_sent, now) for chat_id, status, parts_sent in results]
+            )
+            conn.executemany(
+                'UPDATE subscribers SET active = 0, updated_at = ? WHERE chat_id = ?',
+                [(now, chat_id) for chat_id, status, _ in results if status == DEACTIVATED]
+            )
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+    
+    def prune(self) -> None:
+        self._connect().execute('DELETE FROM broadcast_deliveries WHERE delivered_at < ?',
+                                (time.time() - DELIVERY_RETENTION,))
+    
+    def stats(self) -> Dict[str, int]:
+        row = self._connect().execute('SELECT COUNT(*), COALESCE(SUM(active), 0) FROM subscribers').fetchone()
+        return {'subscribers': row[0], 'active': row[1]}
+
+
+_registry: Optional[SubscriberRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_subscriber_registry() -> SubscriberRegistry:
+    """Общий реестр процесса; чат из CHAT_ID подписан по умолчанию"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = SubscriberRegistry()
+                registry.seed(CHAT_ID)
+                _registry = registry
+    return _registry
+
+
+def scheduled_broadcast_id(name: str, scheduled_at: float, tz: tzinfo) -> str:
+    """id рассылки по плановому времени запуска: догоняющий запуск после рестарта продолжает ту же рассылку"""
+    return f"{name}-{datetime.fromtimestamp(scheduled_at, tz):%Y-%m-%d-%H%M}"
+
+
+def manual_broadcast_id(name: str) -> str:
+    """Ручная рассылка всегда новая и не пересекается с плановыми"""
+    return f"manual-{name}-{int(time.time() * 1000)}"
+
+
+class SendPacer:
+    """Равномерные слоты отправки: не больше rate сообщений в секунду; pause — пауза после RetryAfter"""
+    
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._paused_until = 0.0
+    
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            slot = max(now, self._next, self._paused_until)
+            self._next = slot + self.interval
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            # Пауза могла начаться, пока ждали слот
+            if time.monotonic() >= self._paused_until:
+                return
+    
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class BroadcastReport(NamedTuple):
+    broadcast_id: str
+    total: int
+    sent: int
+    messages: int
+    resumed: int
+    deactivated: int
+    uncertain: int
+    failed: int
+    elapsed: float
+    
+    @property
+    def rate(self) -> float:
+        """Пропускная способность рассылки, сообщений (частей) в секунду"""
+        return self.messages / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class Broadcaster:
+    def __init__(self, bot: Bot, registry: Optional[SubscriberRegistry] = None,
+                 concurrency: int = BROADCAST_CONCURRENCY, rate: float = BROADCAST_RATE,
+                 chat_interval: float = BROADCAST_CHAT_INTERVAL, max_attempts: int = BROADCAST_MAX_ATTEMPTS):
+        self.bot = bot
+        self.registry = registry or get_subscriber_registry()
+        self.concurrency = concurrency
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.last_report: Optional[BroadcastReport] = None
+    
+    def _plan(self, broadcast_id: str) -> Tuple[List[int], Dict[int, int]]:
+        """Активные подписчики и часть, с которой продолжать каждому недоделанному чату"""
+        self.registry.prune()
+        chat_ids = self.registry.active_chat_ids()
+        progress = self.registry.progress(broadcast_id)
+        pending = {}
+        for chat_id in chat_ids:
+            status, parts_sent = progress.get(chat_id, (FAILED, 0))
+            if status not in FINISHED:
+                pending[chat_id] = parts_sent
+        return chat_ids, pending
+    
+    async def broadcast(self, broadcast_id: str, texts: List[str], parse_mode: Optional[str] = 'HTML') -> BroadcastReport:
+        """Рассылает готовые сообщения (одно или несколько частей) всем активным подписчикам"""
+        started = time.monotonic()
+        chat_ids, pending = await asyncio.to_thread(self._plan, broadcast_id)
+        resumed = len(chat_ids) - len(pending) + sum(1 for first in pending.values() if first)
+        if resumed:
+            print(f"📨 Рассылка {broadcast_id}: продолжаем, {resumed} чатов уже обработано полностью или частично")
+        
+        pacer = SendPacer(self.rate)
+        queue: asyncio.Queue = asyncio.Queue()
+        for chat_id, first in pending.items():
+            queue.put_nowait((chat_id, first))
+        results: List[tuple] = []
+        counts = {DELIVERED: 0, DEACTIVATED: 0, UNCERTAIN: 0, FAILED: 0, 'messages': 0}
+        flush_lock = asyncio.Lock()
+        flushed_at = time.monotonic()
+        
+        async def flush() -> None:
+            # Пачки пишутся по очереди: более поздняя отметка чата не перезаписывается более ранней
+            nonlocal flushed_at
+            async with flush_lock:
+                flushed_at = time.monotonic()
+                if not results:
+                    return
+                batch = results[:]
+                del results[:]
+                try:
+                    await asyncio.to_thread(self.registry.record, broadcast_id, batch)
+                except sqlite3.Error as e:
+                    print(f"Не удалось сохранить прогресс рассылки {broadcast_id}: {e}")
+        
+        async def checkpoint(chat_id: int, status: str, parts_sent: int) -> None:
+            results.append((chat_id, status, parts_sent))
+            if len(results) >= CHECKPOINT_BATCH or time.monotonic() - flushed_at >= CHECKPOINT_INTERVAL:
+                await flush()
+        
+        async def sender() -> None:
+            while True:
+                try:
+                    chat_id, first = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                status, parts_sent = await self._deliver(chat_id, texts, first, parse_mode, pacer, checkpoint)
+                counts[status] += 1
+                counts['messages'] += parts_sent - first
+                await checkpoint(chat_id, status, parts_sent)
+        
+        tasks = [asyncio.ensure_future(sender()) for _ in range(min(self.concurrency, len(pending)))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Если один отправитель упал, остальные не продолжают рассылку без отметок
+            for task in tasks:
+                task.cancel()
+            await flush()
+        
+        report = BroadcastReport(broadcast_id, len(chat_ids), counts[DELIVERED], counts['messages'], resumed,
+                                 counts[DEACTIVATED], counts[UNCERTAIN], counts[FAILED],
+                                 time.monotonic() - started)
+        self.last_report = report
+        print(f"📨 Рассылка {broadcast_id}: доставлено {report.sent}/{len(pending)}, "
+              f"отключено {report.deactivated}, без ответа {report.uncertain}, ошибок {report.failed}, "
+              f"{report.elapsed:.1f} с ({report.rate:.1f} сообщ./с)")
+        return report
+    
+    async def _deliver(self, chat_id: int, texts: List[str], first: int, parse_mode: Optional[str],
+                       pacer: SendPacer, checkpoint: Callable[[int, str, int], Awaitable[None]]) -> Tuple[str, int]:
+        """
+        Отправляет чату части, начиная с first; возвращает статус и число отправленных частей
+        Каждая отправленная часть, кроме последней, отмечается как PARTIAL
+        """
+        part = first
+        attempts = 0
+        next_allowed = 0.0
+        while part < len(texts):
+            # Лимит на чат: части одного сообщения не чаще chat_interval
+            delay = next_allowed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await pacer.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=texts[part], parse_mode=parse_mode,
+                                            disable_web_page_preview=True)
+            except RetryAfter as e:
+                # Ограничение Telegram действует на весь бот: останавливаем всех отправителей.
+                # Сообщение с RetryAfter не доставлено, повтор безопасен
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+                pacer.pause(retry_after)
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    print(f"Рассылка в {chat_id} не удалась: превышен лимит Telegram")
+                    return FAILED, part
+                continue
+            except Forbidden as e:
+                print(f"Подписчик {chat_id} отключен: {e}")
+                return DEACTIVATED, part
+            except BadRequest as e:
+                if 'chat not found' in str(e).lower():
+                    print(f"Подписчик {chat_id} отключен: {e}")
+                    return DEACTIVATED, part
+                print(f"Рассылка в {chat_id} не удалась: {e}")
+                return FAILED, part
+            except TimedOut as e:
+                # Запрос мог дойти до Telegram: повтор рискует дублем, поэтому чат больше не трогаем
+                print(f"Рассылка в {chat_id}: нет ответа от Telegram, повтор не отправляется ({e})")
+                return UNCERTAIN, part
+            except NetworkError as e:
+                # Соединение не установлено — сообщение не ушло, можно повторить
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    print(f"Рассылка в {chat_id} не удалась: {e}")
+                    return FAILED, part
+                await asyncio.sleep(attempts)
+                continue
+            except TelegramError as e:
+                print(f"Рассылка в {chat_id} не удалась: {e}")
+                return FAILED, part
+            part += 1
+            attempts = 0
+            next_allowed = time.monotonic() + self.chat_interval
+            if part < len(texts):
+                await checkpoint(chat_id, PARTIAL, part)
+        return DELIVERED, part
+
+
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /subscribe"""
+    await asyncio.to_thread(lambda: get_subscriber_registry().subscribe(update.effective_chat.id))
+    await update.message.reply_text("✅ Вы подписаны на ежедневные рекомендации. Отписаться: /unsubscribe")
+
+
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /unsubscribe"""
+    await asyncio.to_thread(lambda: get_subscriber_registry().unsubscribe(update.effective_chat.id))
+    await update.message.reply_text("🔕 Вы отписаны от ежедневных рекомендаций. Подписаться снова: /subscribe")
+
+
+def add_subscription_handlers(application: Application) -> None:
+    """Подключает команды /subscribe и /unsubscribe"""
+    application.add_handler(CommandHandler("subscribe", subscribe_command))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
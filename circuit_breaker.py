@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Circuit breaker для провайдеров рыночных данных
+После серии ошибок провайдер временно пропускается, затем один пробный запрос проверяет восстановление
+"""
+
+import threading
+import time
+from typing import Dict
+
+from config import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Провайдер временно отключен circuit breaker-ом"""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str,
+                 failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """Открыт и время ожидания еще не вышло (пробный запрос пока не положен)"""
+        with self.lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow_request(self) -> bool:
+        """Можно ли сейчас обращаться к провайдеру"""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Пропускаем ровно один пробный запрос, остальные ждут его результата
+                self.state = HALF_OPEN
+                print(f"🔌 {self.name}: пробный запрос после паузы")
+                return True
+            return False
+
+    def release_probe(self) -> None:
+        """Пробный запрос не был отправлен: снова разрешаем пробу"""
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+                self.opened_at = time.monotonic() - self.reset_timeout
+
+    def record_success(self) -> None:
+        with self.lock:
+            if self.state != CLOSED:
+                print(f"🔌 {self.name}: провайдер восстановился")
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    print(f"🔌 {self.name}: провайдер отключен на {self.reset_timeout:.0f} с "
+                          f"после {self.failures} ошибок подряд")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Возвращает breaker провайдера (один на процесс)"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
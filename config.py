@@ -23,3 +23,76 @@ TIMEZONE = "Europe/Moscow"
 # Параметры для анализа криптовалют
 MIN_MARKET_CAP = 10000000  # Минимальная капитализация в долларах
 MIN_VOLUME_24H = 1000000   # Минимальный объем торгов за 24 часа
+
+# Параметры HTTP-клиента для провайдеров рыночных данных
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))   # Таймаут соединения, сек
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '15'))        # Таймаут чтения ответа, сек
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '16'))                # Keep-alive соединений на хост
+
+# Лимиты запросов к провайдерам: хост -> (запросов в секунду, размер пачки)
+# Бюджет общий для всех процессов (воркеры, планировщик, интерактивный бот)
+PROVIDER_RATE_LIMITS = {
+    'api.coingecko.com': (0.5, 5),
+    'api.coinpaprika.com': (2, 10),
+    'query1.finance.yahoo.com': (10, 30),
+}
+RATE_LIMIT_DB_PATH = os.getenv('RATE_LIMIT_DB_PATH', '/tmp/provider_rate_limits.sqlite3')
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '20'))  # Дольше ждать токен не будем, сек
+RATE_LIMIT_DEFAULT_PENALTY = 60  # Пауза после 429 без Retry-After, сек
+
+# Параллельная загрузка акций
+STOCKS_FETCH_WORKERS = int(os.getenv('STOCKS_FETCH_WORKERS', '16'))  # Одновременных запросов
+STOCKS_BULK_CHUNK_SIZE = int(os.getenv('STOCKS_BULK_CHUNK_SIZE', '50'))  # Тикеров в одном пакетном запросе
+
+# Загрузка рынка CoinGecko постранично (до 250 монет на страницу)
+CRYPTO_UNIVERSE_SIZE = int(os.getenv('CRYPTO_UNIVERSE_SIZE', '1000'))  # Сколько монет анализировать
+CRYPTO_MAX_PAGES = int(os.getenv('CRYPTO_MAX_PAGES', '8'))             # Максимум страниц за обновление
+CRYPTO_PAGE_WORKERS = int(os.getenv('CRYPTO_PAGE_WORKERS', '4'))       # Страниц одновременно
+
+# Хеджирование: через сколько секунд без ответа CoinGecko параллельно запрашивать CoinPaprika (0 — выключено)
+CRYPTO_HEDGE_DELAY = float(os.getenv('CRYPTO_HEDGE_DELAY', '3'))
+
+# Circuit breaker провайдеров
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3'))  # Ошибок подряд до отключения
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', '60'))       # Пауза до пробного запроса, сек
+
+# Рыночные снимки: свежесть и фоновое обновление
+SNAPSHOT_TTL = int(os.getenv('SNAPSHOT_TTL', '900'))                  # Снимок считается свежим, сек
+SNAPSHOT_MAX_STALE = int(os.getenv('SNAPSHOT_MAX_STALE', '21600'))    # Устаревший снимок отдаем до, сек
+CRYPTO_PAGE_TTL = int(os.getenv('CRYPTO_PAGE_TTL', '300'))            # Кеш отдельной страницы CoinGecko, сек
+CRYPTO_REFRESH_INTERVAL = int(os.getenv('CRYPTO_REFRESH_INTERVAL', '600'))  # Фоновое обновление крипты, сек
+STOCKS_REFRESH_INTERVAL = int(os.getenv('STOCKS_REFRESH_INTERVAL', '600'))  # Фоновое обновление акций, сек
+STOCKS_UNIVERSE_SIZE = int(os.getenv('STOCKS_UNIVERSE_SIZE', '30'))  # Сколько акций анализировать
+MEMORY_CACHE_MAX_ENTRIES = int(os.getenv('MEMORY_CACHE_MAX_ENTRIES', '64'))  # Снимков в памяти процесса
+MEMORY_CACHE_COHERENCE = float(os.getenv('MEMORY_CACHE_COHERENCE', '5'))     # Сколько доверять памяти без сверки с хранилищем, сек
+SNAPSHOT_DB_PATH = os.getenv('SNAPSHOT_DB_PATH', '/tmp/market_snapshots.sqlite3')  # Общее хранилище снимков
+
+# Правила оценки активов (веса и пороги), перечитываются при изменении файла
+SCORING_RULES_PATH = os.getenv('SCORING_RULES_PATH',
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scoring_rules.json'))
+SCORING_RULES_CHECK_INTERVAL = float(os.getenv('SCORING_RULES_CHECK_INTERVAL', '5'))  # Проверка mtime не чаще, сек
+
+# Потоки для синхронной работы анализаторов из async-обработчиков бота
+ANALYZER_WORKERS = int(os.getenv('ANALYZER_WORKERS', '4'))
+
+# Webhook-сервер: очередь обновлений (параллельность задает POLLING_CONCURRENCY)
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '500'))     # Обновлений в очереди, дальше 503
+WEBHOOK_RETRY_AFTER = int(os.getenv('WEBHOOK_RETRY_AFTER', '5'))     # Retry-After при переполнении, сек
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')         # Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+
+# Защита от повторной доставки обновлений Telegram
+UPDATE_DEDUP_WINDOW = int(os.getenv('UPDATE_DEDUP_WINDOW', '3600'))            # Сколько помнить update_id, сек
+UPDATE_DEDUP_MAX_ENTRIES = int(os.getenv('UPDATE_DEDUP_MAX_ENTRIES', '10000'))  # update_id в памяти процесса
+
+# Параллельная обработка обновлений (polling и webhook), порядок внутри чата сохраняется
+POLLING_CONCURRENCY = int(os.getenv('POLLING_CONCURRENCY', '16'))   # Одновременно обрабатываемых обновлений
+POLLING_MAX_PENDING = int(os.getenv('POLLING_MAX_PENDING', '1000'))  # Обновлений в обработке и ожидании
+
+# Планировщик ежедневных задач: пропущенный запуск выполняется после рестарта, если опоздание не больше окна
+SCHEDULER_MISFIRE_GRACE = int(os.getenv('SCHEDULER_MISFIRE_GRACE', '21600'))  # Окно догоняющего запуска, сек
+
+# Рассылка ежедневных рекомендаций подписчикам (лимиты Telegram: ~30 сообщений/с всего, 1/с в чат)
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '20'))       # Одновременных отправок
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))                   # Сообщений в секунду всего
+BROADCAST_CHAT_INTERVAL = float(os.getenv('BROADCAST_CHAT_INTERVAL', '1'))  # Пауза между сообщениями в чат, сек
+BROADCAST_MAX_ATTEMPTS = int(os.getenv('BROADCAST_MAX_ATTEMPTS', '3'))      # Попыток на подписчика
@@ -1,13 +1,46 @@
-import requests
-import json
-from typing import List, Dict, Any
-import time
-import os
-import hashlib
-from config import COINGECKO_API_KEY, MIN_MARKET_CAP, MIN_VOLUME_24H, MAX_PRICE_PER_COIN
+from typing import List, Dict, Any, Optional, Tuple
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from config import (COINGECKO_API_KEY, MIN_MARKET_CAP, MIN_VOLUME_24H, MAX_PRICE_PER_COIN,
+                    CRYPTO_UNIVERSE_SIZE, CRYPTO_MAX_PAGES, CRYPTO_PAGE_WORKERS, CRYPTO_HEDGE_DELAY,
+                    RATE_LIMIT_MAX_WAIT, CRYPTO_PAGE_TTL, CRYPTO_REFRESH_INTERVAL)
+from asset_pipeline import AssetAnalyzer
+from http_client import get_provider_client
+from market_snapshot import MarketSnapshot, FLOAT, INT, TEXT
+from market_cache import get_market_cache
+from rate_limiter import parse_retry_after
+from scoring_engine import column
+from tiered_selection import Tier, STRICT, RELAXED, FALLBACK
 
-class CryptoAnalyzer:
+# Колонки снимка: имя поля в рекомендации -> извлечение из записи CoinGecko/CoinPaprika
+CRYPTO_FIELDS = [
+    ('id', lambda coin: coin.get('id'), TEXT),
+    ('symbol', lambda coin: (coin.get('symbol') or '').upper(), TEXT),
+    ('name', lambda coin: coin.get('name'), TEXT),
+    ('current_price', lambda coin: coin.get('current_price'), FLOAT),
+    ('market_cap', lambda coin: coin.get('market_cap'), FLOAT),
+    ('volume_24h', lambda coin: coin.get('total_volume'), FLOAT),
+    ('price_change_24h', lambda coin: coin.get('price_change_percentage_24h',
+                                               coin.get('price_change_percentage_24h_in_currency')), FLOAT),
+    # CoinGecko возвращает 7д как price_change_percentage_7d_in_currency
+    ('price_change_7d', lambda coin: coin.get('price_change_percentage_7d_in_currency',
+                                              coin.get('price_change_percentage_7d')), FLOAT),
+    ('market_cap_rank', lambda coin: coin.get('market_cap_rank'), INT),
+    ('image', lambda coin: coin.get('image'), TEXT),
+]
+
+class CryptoAnalyzer(AssetAnalyzer):
+    asset_class = 'crypto'
+    fields = CRYPTO_FIELDS
+    universe_size = CRYPTO_UNIVERSE_SIZE
+    items_label = 'криптовалют'
+    suitable_label = 'монет'
+    snapshot_prefix = 'crypto'
+    refresh_interval = CRYPTO_REFRESH_INTERVAL
+    
     def __init__(self):
+        super().__init__()
         self.base_url = "https://api.coingecko.com/api/v3"
         self.headers = {
             # CoinGecko иногда требует User-Agent
@@ -15,36 +48,22 @@ class CryptoAnalyzer:
         }
         if COINGECKO_API_KEY:
             self.headers['X-CG-API-KEY'] = COINGECKO_API_KEY
+        # Общий клиент с keep-alive пулами соединений
+        self.http = get_provider_client()
+        # Кеш снимков: память процесса поверх файлов в /tmp
+        self.cache = get_market_cache('coingecko')
     
-    def _cache_path(self, key: str) -> str:
-        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
-        return os.path.join('/tmp', f'coingecko_cache_{digest}.json')
-
-    def _read_cache(self, key: str, ttl_seconds: int = 900) -> List[Dict[str, Any]]:
-        try:
-            path = self._cache_path(key)
-            if not os.path.exists(path):
-                return []
-            # TTL check
-            if time.time() - os.path.getmtime(path) > ttl_seconds:
-                return []
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            return []
-
-    def _write_cache(self, key: str, data: List[Dict[str, Any]]) -> None:
-        try:
-            path = self._cache_path(key)
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(data, f)
-        except Exception:
-            pass
-
     def get_top_cryptocurrencies(self, limit: int = 150) -> List[Dict[str, Any]]:
         """
         Получает топ криптовалют с базовой информацией
         """
+        return self.get_snapshot(limit)[1]
+
+    def fetch_universe(self, limit: int) -> List[Dict[str, Any]]:
+        """Запрашивает рынок у провайдеров, без резервных данных"""
+        if CRYPTO_HEDGE_DELAY > 0:
+            return self._fetch_hedged(limit)
+
         # Пробуем CoinGecko
         cg_data = self._try_coingecko(limit)
         if cg_data:
@@ -52,52 +71,138 @@ class CryptoAnalyzer:
         
         # Если CoinGecko не работает, пробуем альтернативный источник
         print("CoinGecko недоступен, используем альтернативный источник...")
-        return self._try_alternative_source(limit)
+        return self._try_coinpaprika(limit)
     
-    def _try_coingecko(self, limit: int) -> List[Dict[str, Any]]:
-        """Пробует получить данные с CoinGecko"""
+    def _fetch_hedged(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Хеджированный запрос: если CoinGecko не ответил за CRYPTO_HEDGE_DELAY секунд
+        (или ответил пустым), параллельно запускаем CoinPaprika и берем первый непустой ответ.
+        Проигравший запрос отменяется: ретраи и паузы прерываются через общий флаг
+        """
+        cancel_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='crypto-hedge')
+        try:
+            primary = executor.submit(self._try_coingecko, limit, cancel_event)
+            done, pending = wait([primary], timeout=CRYPTO_HEDGE_DELAY)
+            if done:
+                rows = primary.result()
+                if rows:
+                    return rows
+                print("CoinGecko недоступен, используем альтернативный источник...")
+            else:
+                print(f"CoinGecko не ответил за {CRYPTO_HEDGE_DELAY} с, параллельно запрашиваем CoinPaprika...")
+
+            pending.add(executor.submit(self._try_coinpaprika, limit, cancel_event))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rows = future.result()
+                    if rows:
+                        return rows
+            return []
+        finally:
+            cancel_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _try_coingecko(self, limit: int,
+                       cancel_event: Optional[threading.Event] = None) -> List[Dict[str, Any]]:
+        """Пробует получить данные с CoinGecko (несколько страниц параллельно)"""
+        per_page = max(1, min(250, limit))
+        pages = min(CRYPTO_MAX_PAGES, -(-limit // per_page))
+        if pages <= 1:
+            return self._fetch_coingecko_page(1, per_page, cancel_event)
+
+        # Страницы загружаются параллельно, частоту запросов ограничивает общий HTTP-клиент.
+        # Склейка идет потоком: готовая страница сразу добавляется к результату, как только
+        # пришли все предыдущие; упавшая страница (None) просто пропускается
+        merged: List[Dict[str, Any]] = []
+        seen = set()
+        arrived: Dict[int, Optional[List[Dict[str, Any]]]] = {}
+        next_page = 1
+        received = 0
+        with ThreadPoolExecutor(max_workers=min(pages, CRYPTO_PAGE_WORKERS),
+                                thread_name_prefix='coingecko-page') as executor:
+            futures = {executor.submit(self._fetch_coingecko_page, page, per_page, cancel_event): page
+                       for page in range(1, pages + 1)}
+            for future in as_completed(futures):
+                rows = future.result()
+                received += 1 if rows else 0
+                arrived[futures[future]] = rows or None
+                # Монета могла сместиться между страницами: дубли убираются по id
+                while next_page in arrived:
+                    for coin in arrived.pop(next_page) or ():
+                        coin_id = coin.get('id')
+                        if coin_id in seen:
+                            continue
+                        seen.add(coin_id)
+                        merged.append(coin)
+                    next_page += 1
+
+        if received < pages:
+            print(f"CoinGecko: получено {received} из {pages} страниц")
+        return merged[:limit]
+
+    def _fetch_coingecko_page(self, page: int, per_page: int,
+                              cancel_event: Optional[threading.Event] = None) -> List[Dict[str, Any]]:
+        """Загружает одну страницу рынка CoinGecko (со своим кешем)"""
+        cancel_event = cancel_event or threading.Event()
         try:
             url = f"{self.base_url}/coins/markets"
             params = {
                 'vs_currency': 'usd',
                 'order': 'market_cap_desc',
-                'per_page': min(250, limit),
-                'page': 1,
+                'per_page': per_page,
+                'page': page,
                 'sparkline': False,
                 'price_change_percentage': '24h,7d'
             }
 
             cache_key = f"coins_markets_{params['vs_currency']}_{params['per_page']}_{params['page']}"
-            cached = self._read_cache(cache_key)
+            cached = self.cache.read(cache_key, CRYPTO_PAGE_TTL)
             if cached:
                 return cached
 
             max_retries = 2  # Уменьшили количество попыток
             backoff = 5
             for attempt in range(max_retries):
-                response = requests.get(url, params=params, headers=self.headers, timeout=15)
+                if cancel_event.is_set():
+                    return []
+                response = self.http.get(url, params=params, headers=self.headers)
                 if response.status_code == 200:
                     rows = response.json()
                     if isinstance(rows, list) and rows:
-                        self._write_cache(cache_key, rows)
+                        self.cache.write(cache_key, rows)
                         return rows
                     return []
                 
                 if response.status_code == 429:
-                    print(f"CoinGecko 429. Skipping to alternative source.")
+                    # Лимитер уже поставил паузу по Retry-After; если она короткая — ждем и повторяем
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    if (attempt + 1 < max_retries and retry_after is not None
+                            and retry_after <= RATE_LIMIT_MAX_WAIT):
+                        print(f"CoinGecko 429 (страница {page}). Повтор через {retry_after:.0f} с.")
+                        continue
+                    print(f"CoinGecko 429 (страница {page}). Страница пропущена.")
                     return []
                 
                 print(f"CoinGecko HTTP {response.status_code}: {response.text[:100]}")
-                time.sleep(backoff)
+                if self.http.is_open(url):
+                    # Провайдер уже отключен, паузу и повтор не ждем
+                    return []
+                # Пауза прерывается, если запрос отменили (хеджирование)
+                if cancel_event.wait(backoff):
+                    return []
 
             return []
         except Exception as e:
-            print(f"CoinGecko error: {e}")
+            print(f"CoinGecko error (страница {page}): {e}")
             return []
     
-    def _try_alternative_source(self, limit: int) -> List[Dict[str, Any]]:
-        """Альтернативный источник данных"""
-        # Пробуем CoinPaprika API
+    def _try_coinpaprika(self, limit: int,
+                         cancel_event: Optional[threading.Event] = None) -> List[Dict[str, Any]]:
+        """Пробует получить данные с CoinPaprika в формате CoinGecko"""
+        if cancel_event is not None and cancel_event.is_set():
+            return []
         try:
             print("Пробуем CoinPaprika API...")
             url = "https://api.coinpaprika.com/v1/tickers"
@@ -106,7 +211,7 @@ class CryptoAnalyzer:
                 'limit': min(100, limit)
             }
             
-            response = requests.get(url, params=params, timeout=15)
+            response = self.http.get(url, params=params)
             if response.status_code == 200:
                 data = response.json()
                 
@@ -137,11 +242,9 @@ class CryptoAnalyzer:
         except Exception as e:
             print(f"CoinPaprika error: {e}")
         
-        # Если CoinPaprika не работает, используем резервные данные
-        print("Используем резервные данные...")
-        return self._get_fallback_data()
+        return []
     
-    def _get_fallback_data(self) -> List[Dict[str, Any]]:
+    def fallback_snapshot(self) -> List[Dict[str, Any]]:
         """Резервные данные, если все API недоступны"""
         print("Используем резервные данные")
         return [
@@ -211,164 +314,28 @@ class CryptoAnalyzer:
         """
         Фильтрует криптовалюты по критериям для инвестирования
         """
-        suitable_coins = []
-        
-        for coin in cryptocurrencies:
-            try:
-                # Проверяем базовые критерии
-                if (coin.get('market_cap', 0) >= MIN_MARKET_CAP and
-                    coin.get('total_volume', 0) >= MIN_VOLUME_24H and
-                    coin.get('current_price', 0) <= MAX_PRICE_PER_COIN and
-                    coin.get('current_price', 0) > 0.01):  # Минимальная цена 1 цент
-                    
-                    # Добавляем дополнительную информацию
-                    coin_info = {
-                        'id': coin.get('id'),
-                        'symbol': coin.get('symbol', '').upper(),
-                        'name': coin.get('name'),
-                        'current_price': coin.get('current_price', 0),
-                        'market_cap': coin.get('market_cap', 0),
-                        'volume_24h': coin.get('total_volume', 0),
-                        'price_change_24h': coin.get('price_change_percentage_24h', 0),
-                        # CoinGecko возвращает 7д как price_change_percentage_7d_in_currency
-                        'price_change_7d': coin.get('price_change_percentage_7d_in_currency', coin.get('price_change_percentage_7d', 0) or 0),
-                        'market_cap_rank': coin.get('market_cap_rank', 0),
-                        'image': coin.get('image', '')
-                    }
-                    
-                    suitable_coins.append(coin_info)
-            except Exception as e:
-                print(f"Ошибка при обработке монеты {coin.get('name', 'Unknown')}: {e}")
-                continue
-        
-        # Если подходящих монет мало, ослабляем критерии
-        if len(suitable_coins) < 3:
-            print(f"Строгие критерии дали {len(suitable_coins)} монет, ослабляем...")
-            suitable_coins = []
-            
-            for coin in cryptocurrencies:
-                try:
-                    # Ослабленные критерии
-                    if (coin.get('current_price', 0) <= 5.0 and  # До $5
-                        coin.get('current_price', 0) > 0.001 and  # Минимум 0.1 цент
-                        coin.get('total_volume', 0) >= 5000000):  # Объем от $5M
-                        
-                        coin_info = {
-                            'id': coin.get('id'),
-                            'symbol': coin.get('symbol', '').upper(),
-                            'name': coin.get('name'),
-                            'current_price': coin.get('current_price', 0),
-                            'market_cap': coin.get('market_cap', 0),
-                            'volume_24h': coin.get('total_volume', 0),
-                            'price_change_24h': coin.get('price_change_percentage_24h', 0),
-                            'price_change_7d': coin.get('price_change_percentage_7d_in_currency', coin.get('price_change_percentage_7d', 0) or 0),
-                            'market_cap_rank': coin.get('market_cap_rank', 0),
-                            'image': coin.get('image', '')
-                        }
-                        
-                        suitable_coins.append(coin_info)
-                except Exception as e:
-                    print(f"Ошибка при обработке монеты {coin.get('name', 'Unknown')}: {e}")
-                    continue
-            
-            # Сортируем по рангу (лучшие монеты)
-            suitable_coins.sort(key=lambda x: x.get('market_cap_rank', 999999))
-        
-        return suitable_coins
+        return self.filter_records(cryptocurrencies)
     
-    def calculate_investment_score(self, coin: Dict[str, Any]) -> float:
-        """
-        Рассчитывает оценку привлекательности для инвестирования
-        """
-        score = 0.0
-        
-        # Оценка по цене (чем дешевле, тем лучше)
-        price = coin.get('current_price', 0)
-        if price > 0:
-            price_score = max(0, 10 - price)  # Максимум 10 баллов за очень дешевые монеты
-            score += price_score * 0.3
-        
-        # Оценка по объему торгов (чем больше объем, тем лучше)
-        volume = coin.get('volume_24h', 0)
-        if volume > 0:
-            volume_score = min(10, volume / 10000000)  # 10 баллов за объем > 100M
-            score += volume_score * 0.2
-        
-        # Оценка по капитализации (умеренная капитализация лучше)
-        market_cap = coin.get('market_cap', 0)
-        if market_cap > 0:
-            if 10000000 <= market_cap <= 1000000000:  # 10M - 1B
-                market_cap_score = 10
-            elif market_cap < 10000000:
-                market_cap_score = 5
-            else:
-                market_cap_score = 7
-            score += market_cap_score * 0.2
-        
-        # Оценка по изменению цены (небольшой рост лучше)
-        price_change_24h = coin.get('price_change_24h', 0)
-        if -20 <= price_change_24h <= 10:  # Оптимальный диапазон
-            price_change_score = 10
-        elif price_change_24h < -20:
-            price_change_score = 5  # Возможность для покупки на дне
-        else:
-            price_change_score = 3  # Слишком большой рост
-        score += price_change_score * 0.3
-        
-        return score
+    def selection_tiers(self, snapshot: MarketSnapshot) -> List[Tier]:
+        """Маски уровней отбора по колонкам снимка"""
+        price = column(snapshot, 'current_price')
+        market_cap = column(snapshot, 'market_cap')
+        volume = column(snapshot, 'volume_24h')
+        rank = column(snapshot, 'market_cap_rank')
+        return [
+            # Базовые критерии, минимальная цена 1 цент; если монет мало — ослабляем
+            Tier(STRICT, (market_cap >= MIN_MARKET_CAP) & (volume >= MIN_VOLUME_24H) &
+                 (price > 0.01) & (price <= MAX_PRICE_PER_COIN), min_count=3),
+            # До $5, минимум 0.1 цент, объем от $5M; лучшие по рангу
+            Tier(RELAXED, (price > 0.001) & (price <= 5.0) & (volume >= 5000000), order=[rank]),
+            # Если после фильтра пусто — берем лучшие по рангу из уже полученных данных,
+            # чтобы не делать повторный вызов API и не ловить 429
+            Tier(FALLBACK, (price <= MAX_PRICE_PER_COIN) & (volume >= 5_000_000),
+                 order=[np.where(rank == 0, 10_000, rank)], scored=False),
+        ]
     
-    def get_top_3_recommendations(self) -> List[Dict[str, Any]]:
-        """
-        Возвращает топ-3 рекомендации для покупки
-        """
-        print("🚀 Начинаем получение рекомендаций...")
-        
-        # Получаем топ криптовалют
-        cryptocurrencies = self.get_top_cryptocurrencies(limit=200)
-        
-        print(f"📊 Получено {len(cryptocurrencies) if cryptocurrencies else 0} криптовалют")
-        
-        # Фильтруем подходящие
-        suitable_coins = self.filter_suitable_cryptocurrencies(cryptocurrencies)
-        
-        print(f"✅ Найдено {len(suitable_coins) if suitable_coins else 0} подходящих монет")
-        
-        # Рассчитываем оценки и сортируем
-        for coin in suitable_coins:
-            coin['investment_score'] = self.calculate_investment_score(coin)
-        
-        # Сортируем по оценке инвестирования (по убыванию)
-        suitable_coins.sort(key=lambda x: x.get('investment_score', 0), reverse=True)
-        
-        # Если после фильтра пусто — сформируем fallback из уже полученных данных,
-        # чтобы не делать повторный вызов API и не ловить 429.
-        if not suitable_coins:
-            fallback: List[Dict[str, Any]] = []
-            for coin in cryptocurrencies:
-                try:
-                    if coin.get('current_price', 0) <= MAX_PRICE_PER_COIN and coin.get('total_volume', 0) >= 5_000_000:
-                        fallback.append({
-                            'id': coin.get('id'),
-                            'symbol': coin.get('symbol', '').upper(),
-                            'name': coin.get('name'),
-                            'current_price': coin.get('current_price', 0),
-                            'market_cap': coin.get('market_cap', 0),
-                            'volume_24h': coin.get('total_volume', 0),
-                            'price_change_24h': coin.get('price_change_percentage_24h', coin.get('price_change_percentage_24h_in_currency', 0) or 0),
-                            'price_change_7d': coin.get('price_change_percentage_7d_in_currency', 0),
-                            'market_cap_rank': coin.get('market_cap_rank', 0),
-                            'image': coin.get('image', ''),
-                            'investment_score': 0.0,
-                        })
-                except Exception:
-                    continue
-            fallback.sort(key=lambda x: (x.get('market_cap_rank') or 10_000))
-            return fallback[:3]
-
-        # Возвращаем топ-3
-        result = suitable_coins[:3]
-        print(f"🏆 Возвращаем {len(result)} рекомендаций")
-        return result
+    def memo_params(self) -> Tuple[Any, ...]:
+        return (CRYPTO_UNIVERSE_SIZE, MIN_MARKET_CAP, MIN_VOLUME_24H, MAX_PRICE_PER_COIN)
     
     def get_coin_description(self, coin: Dict[str, Any]) -> str:
         """
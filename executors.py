@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Пул потоков для блокирующей работы анализаторов
+Обработчики бота await-ят результат, а event loop продолжает обслуживать остальные чаты
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from config import ANALYZER_WORKERS
+from single_flight import get_single_flight
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_analyzer_executor() -> ThreadPoolExecutor:
+    """Общий пул анализаторов; размер ограничен ANALYZER_WORKERS, лишние вызовы ждут в очереди"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=ANALYZER_WORKERS,
+                                               thread_name_prefix='analyzer')
+    return _executor
+
+
+async def run_recommendations(analyzer: Any) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    get_versioned_recommendations анализатора из async-кода
+    Одновременные запросы с тем же ключом ждут один расчет и не занимают потоки пула
+    """
+    future = get_single_flight().submit(analyzer.recommendations_key(), get_analyzer_executor(),
+                                        analyzer.compute_versioned_recommendations)
+    # shield: отмена одного ожидающего (например, закрытый чат) не должна отменять общий расчет
+    return await asyncio.shield(asyncio.wrap_future(future))
+
+
+def shutdown_analyzer_executor() -> None:
+    """Останавливает пул (при остановке процесса)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
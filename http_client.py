@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Общий HTTP-клиент для всех провайдеров рыночных данных
+Держит keep-alive пулы соединений по хостам
+"""
+
+import threading
+from typing import Any, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_SIZE
+from circuit_breaker import CircuitOpenError, get_breaker
+from rate_limiter import HostRateLimiter, parse_retry_after
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class ProviderClient:
+    def __init__(self,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 read_timeout: float = HTTP_READ_TIMEOUT,
+                 pool_size: int = HTTP_POOL_SIZE):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        # Один адаптер держит отдельный пул соединений для каждого хоста
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.rate_limiter = HostRateLimiter()
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+            headers: Optional[Dict[str, str]] = None,
+            timeout: Optional[Timeout] = None) -> requests.Response:
+        """
+        GET-запрос через общий пул соединений с учетом лимита и состояния провайдера.
+        Бросает CircuitOpenError, если провайдер отключен после серии ошибок,
+        и RateLimitExceeded, если лимит не освободился за RATE_LIMIT_MAX_WAIT
+        """
+        host = urlsplit(url).netloc
+        breaker = get_breaker(host)
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"{host}: провайдер временно отключен")
+        try:
+            self.rate_limiter.acquire(host)
+        except Exception:
+            # Запрос так и не ушел; если это был пробный запрос, вернем его следующему
+            breaker.release_probe()
+            raise
+        try:
+            response = self.session.get(url, params=params, headers=headers,
+                                        timeout=timeout or self.timeout)
+        except Exception:
+            breaker.record_failure()
+            raise
+        if response.status_code == 429 or response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if response.status_code == 429:
+            # Сообщаем лимитеру, чтобы остальные процессы тоже переждали
+            self.rate_limiter.penalize(host, parse_retry_after(response.headers.get('Retry-After')))
+        return response
+
+    def is_open(self, url: str) -> bool:
+        """Отключен ли сейчас провайдер этого URL"""
+        return get_breaker(urlsplit(url).netloc).is_open
+
+    def close(self) -> None:
+        """Закрывает соединения"""
+        self.session.close()
+
+
+_client: Optional[ProviderClient] = None
+_client_lock = threading.Lock()
+
+
+def get_provider_client() -> ProviderClient:
+    """Возвращает общий клиент процесса"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ProviderClient()
+    return _client
+
+
+def close_provider_client() -> None:
+    """Закрывает общий клиент (при остановке процесса)"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -5,16 +5,21 @@
 """
 
 import asyncio
-import os
 from datetime import datetime
 import pytz
 from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
-from telegram.error import TelegramError
+from telegram.error import BadRequest
 from crypto_analyzer import CryptoAnalyzer
 from stocks_analyzer import StocksAnalyzer
 from bonds_analyzer import BondsAnalyzer
-from config import TELEGRAM_BOT_TOKEN, CHAT_ID, DAILY_BUDGET
+from snapshot_refresher import get_refresher
+from update_dedup import add_dedup_handler
+from broadcast import add_subscription_handlers
+from update_processor import ChatOrderedUpdateProcessor
+from executors import run_recommendations
+from message_renderer import INTERACTIVE, get_renderer
+from config import TELEGRAM_BOT_TOKEN
 
 class InvestmentAdvisorBot:
     def __init__(self):
@@ -23,6 +28,14 @@ class InvestmentAdvisorBot:
         self.stocks_analyzer = StocksAnalyzer()
         self.bonds_analyzer = BondsAnalyzer()
         self.moscow_tz = pytz.timezone("Europe/Moscow")
+        self.renderer = get_renderer()
+    
+    def start_background_refresh(self):
+        """Запускает фоновое обновление снимков крипты и акций"""
+        refresher = get_refresher()
+        self.crypto_analyzer.schedule_refresh(refresher)
+        self.stocks_analyzer.schedule_refresh(refresher)
+        refresher.start()
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
@@ -82,234 +95,53 @@ class InvestmentAdvisorBot:
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await query.edit_message_text(
-            message,
-            reply_markup=reply_markup,
-            parse_mode='HTML'
-        )
+        await self.edit_message(query, message, reply_markup=reply_markup, parse_mode='HTML')
     
-    async def show_crypto_recommendations(self, query):
-        """Показывает рекомендации по криптовалютам"""
-        await query.edit_message_text("🔍 Анализирую рынок криптовалют...")
+    async def edit_message(self, query, text: str, reply_markup=None, parse_mode=None):
+        """
+        Редактирует сообщение. Ответ Telegram "message is not modified" значит, что на экране
+        уже то же содержимое; правку при этом не пропускаем заранее — сообщение могли изменить
+        из другого процесса
+        """
+        try:
+            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+        except BadRequest as e:
+            if 'message is not modified' not in str(e).lower():
+                raise
+    
+    async def show_recommendations(self, query, asset_class: str, analyzer, loading_text: str):
+        """Показывает рекомендации по выбранному классу активов"""
+        keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data='back_to_menu')]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await self.edit_message(query, loading_text)
         
         try:
-            moscow_time = datetime.now(self.moscow_tz)
-            date_str = moscow_time.strftime("%d.%m.%Y")
-            
-            message = f"🪙 <b>РЕКОМЕНДАЦИИ ПО КРИПТОВАЛЮТАМ</b>\n"
-            message += f"📅 Дата: {date_str}\n"
-            message += f"💰 Бюджет: ${DAILY_BUDGET}\n\n"
-            message += f"🔍 <b>ТОП-3 КРИПТОВАЛЮТЫ:</b>\n\n"
-            
-            recommendations = self.crypto_analyzer.get_top_3_recommendations()
-            
-            if not recommendations:
-                message += "❌ Не удалось получить рекомендации. Попробуйте позже."
-                keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data='back_to_menu')]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='HTML')
-                return
-            
-            for i, coin in enumerate(recommendations, 1):
-                message += f"<b>{i}. {coin['name']} ({coin['symbol']})</b>\n"
-                message += f"💰 Цена: ${coin['current_price']:.4f}\n"
-                message += f"📈 Изменение за 24ч: {coin['price_change_24h']:.1f}%\n"
-                message += f"🏆 Ранг: #{coin['market_cap_rank']}\n"
-                message += f"📊 Объем: ${coin['volume_24h']/1000000:.1f}M\n"
-                
-                # Причины покупки
-                reasons = []
-                price = coin['current_price']
-                price_change = coin['price_change_24h']
-                rank = coin['market_cap_rank']
-                volume = coin['volume_24h']
-                
-                if price <= 0.1:
-                    reasons.append(f"✅ Сверхдоступная цена - за $10 можно купить {int(10/price)} монет")
-                elif price <= 0.5:
-                    reasons.append(f"✅ Очень доступная цена - за $10 можно купить {int(10/price)} монет")
-                elif price <= 1:
-                    reasons.append(f"✅ Доступная цена - за $10 можно купить {int(10/price)} монет")
-                elif price <= 2:
-                    reasons.append(f"✅ Умеренная цена - за $10 можно купить {int(10/price)} монет")
-                
-                if price_change <= -15:
-                    reasons.append(f"✅ Сильная просадка (-{abs(price_change):.1f}%) - отличная возможность")
-                elif price_change <= -8:
-                    reasons.append(f"✅ Значительное падение (-{abs(price_change):.1f}%) - хороший момент")
-                elif price_change <= -3:
-                    reasons.append(f"✅ Небольшая коррекция (-{abs(price_change):.1f}%) - подходящее время")
-                elif price_change >= 5:
-                    reasons.append(f"✅ Позитивный тренд (+{price_change:.1f}%)")
-                
-                if rank <= 100:
-                    reasons.append("🥈 Топ-100 проект - хороший баланс")
-                elif rank <= 200:
-                    reasons.append("🥉 Топ-200 проект - перспективный рост")
-                
-                if volume >= 50000000:
-                    reasons.append("🌊 Высокая ликвидность")
-                elif volume >= 10000000:
-                    reasons.append("💦 Хорошая ликвидность")
-                
-                if reasons:
-                    message += f"🤔 Почему купить: {', '.join(reasons[:3])}\n"
-                message += "\n"
-            
-            keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data='back_to_menu')]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='HTML')
+            # Загрузка и расчет блокирующие: выполняем в пуле, чтобы не замораживать остальные чаты;
+            # одновременные нажатия ждут один и тот же расчет
+            version, recommendations = await run_recommendations(analyzer)
+            rendered = self.renderer.render(asset_class, INTERACTIVE, version, recommendations,
+                                            datetime.now(self.moscow_tz))
+            await self.edit_message(query, rendered.text, reply_markup=reply_markup, parse_mode='HTML')
             
         except Exception as e:
             error_message = f"❌ Ошибка при получении рекомендаций: {str(e)}"
-            keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data='back_to_menu')]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(error_message, reply_markup=reply_markup)
+            await self.edit_message(query, error_message, reply_markup=reply_markup)
+    
+    async def show_crypto_recommendations(self, query):
+        """Показывает рекомендации по криптовалютам"""
+        await self.show_recommendations(query, 'crypto', self.crypto_analyzer,
+                                        "🔍 Анализирую рынок криптовалют...")
     
     async def show_stocks_recommendations(self, query):
         """Показывает рекомендации по акциям"""
-        await query.edit_message_text("🔍 Анализирую рынок акций...")
-        
-        try:
-            moscow_time = datetime.now(self.moscow_tz)
-            date_str = moscow_time.strftime("%d.%m.%Y")
-            
-            message = f"📈 <b>РЕКОМЕНДАЦИИ ПО АКЦИЯМ</b>\n"
-            message += f"📅 Дата: {date_str}\n"
-            message += f"💰 Бюджет: ${DAILY_BUDGET}\n\n"
-            message += f"🔍 <b>ТОП-3 АКЦИИ:</b>\n\n"
-            
-            recommendations = self.stocks_analyzer.get_top_3_recommendations()
-            
-            if not recommendations:
-                message += "❌ Не удалось получить рекомендации. Попробуйте позже."
-                keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data='back_to_menu')]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='HTML')
-                return
-            
-            for i, stock in enumerate(recommendations, 1):
-                message += f"<b>{i}. {stock['name']} ({stock['symbol']})</b>\n"
-                message += f"💰 Цена: ${stock['current_price']:.2f}\n"
-                message += f"📈 Изменение за 24ч: {stock['price_change_24h']:.1f}%\n"
-                message += f"📊 Объем: ${stock['volume_24h']/1000000:.1f}M\n"
-                message += f"💎 Капитализация: ${stock['market_cap']/1000000000:.1f}B\n"
-                
-                # Причины покупки
-                reasons = []
-                price = stock['current_price']
-                price_change = stock['price_change_24h']
-                volume = stock['volume_24h']
-                market_cap = stock.get('market_cap', 0)
-                
-                if price <= 1:
-                    reasons.append(f"✅ Очень доступная цена - за $10 можно купить {int(10/price)} акций")
-                elif price <= 5:
-                    reasons.append(f"✅ Доступная цена - за $10 можно купить {int(10/price)} акций")
-                elif price <= 10:
-                    reasons.append(f"✅ Умеренная цена - за $10 можно купить {int(10/price)} акций")
-                
-                if price_change <= -10:
-                    reasons.append(f"✅ Сильная просадка (-{abs(price_change):.1f}%) - отличная возможность")
-                elif price_change <= -5:
-                    reasons.append(f"✅ Значительное падение (-{abs(price_change):.1f}%) - хороший момент")
-                elif price_change <= -2:
-                    reasons.append(f"✅ Небольшая коррекция (-{abs(price_change):.1f}%) - подходящее время")
-                
-                if market_cap >= 10000000000:  # 10B+
-                    reasons.append("🏆 Крупная компания - высокая стабильность")
-                elif market_cap >= 1000000000:  # 1B+
-                    reasons.append("🥈 Средняя компания - хороший баланс")
-                
-                if volume >= 100000000:
-                    reasons.append("🌊 Высокая ликвидность")
-                
-                if reasons:
-                    message += f"🤔 Почему купить: {', '.join(reasons[:3])}\n"
-                message += "\n"
-            
-            keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data='back_to_menu')]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='HTML')
-            
-        except Exception as e:
-            error_message = f"❌ Ошибка при получении рекомендаций: {str(e)}"
-            keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data='back_to_menu')]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(error_message, reply_markup=reply_markup)
+        await self.show_recommendations(query, 'stocks', self.stocks_analyzer,
+                                        "🔍 Анализирую рынок акций...")
     
     async def show_bonds_recommendations(self, query):
         """Показывает рекомендации по облигациям"""
-        await query.edit_message_text("🔍 Анализирую рынок облигаций...")
-        
-        try:
-            moscow_time = datetime.now(self.moscow_tz)
-            date_str = moscow_time.strftime("%d.%m.%Y")
-            
-            message = f"💼 <b>РЕКОМЕНДАЦИИ ПО ОБЛИГАЦИЯМ</b>\n"
-            message += f"📅 Дата: {date_str}\n"
-            message += f"💰 Бюджет: ${DAILY_BUDGET}\n\n"
-            message += f"🔍 <b>ТОП-3 ОБЛИГАЦИИ:</b>\n\n"
-            
-            recommendations = self.bonds_analyzer.get_top_3_recommendations()
-            
-            if not recommendations:
-                message += "❌ Не удалось получить рекомендации. Попробуйте позже."
-                keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data='back_to_menu')]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='HTML')
-                return
-            
-            for i, bond in enumerate(recommendations, 1):
-                message += f"<b>{i}. {bond['name']} ({bond['symbol']})</b>\n"
-                message += f"💰 Цена: ${bond['current_price']:.2f}\n"
-                message += f"📈 Доходность: {bond['yield']:.2f}%\n"
-                message += f"📅 Погашение: {bond['maturity']}\n"
-                message += f"🏆 Рейтинг: {bond['rating']}\n"
-                message += f"📊 Тип: {bond['type']}\n"
-                message += f"📈 Изменение за 24ч: {bond['price_change_24h']:.2f}%\n"
-                
-                # Причины покупки
-                reasons = []
-                yield_rate = bond.get('yield', 0)
-                rating = bond.get('rating', '')
-                bond_type = bond.get('type', '')
-                price = bond.get('current_price', 100)
-                
-                if yield_rate >= 5.0:
-                    reasons.append(f"✅ Высокая доходность ({yield_rate:.2f}%)")
-                elif yield_rate >= 4.0:
-                    reasons.append(f"✅ Хорошая доходность ({yield_rate:.2f}%)")
-                
-                if rating in ['AAA', 'AA', 'AA+', 'AA-']:
-                    reasons.append(f"🏆 Высокий рейтинг ({rating}) - низкий риск")
-                elif rating in ['A', 'A+', 'A-']:
-                    reasons.append(f"🥈 Хороший рейтинг ({rating})")
-                
-                if bond_type == 'Government':
-                    reasons.append("🛡️ Государственная облигация - максимальная безопасность")
-                elif bond_type == 'Corporate':
-                    reasons.append("💼 Корпоративная облигация - баланс риска и доходности")
-                
-                if abs(price - 100) <= 2:
-                    reasons.append("✅ Цена близка к номиналу - стабильность")
-                
-                if reasons:
-                    message += f"🤔 Почему купить: {', '.join(reasons[:3])}\n"
-                message += "\n"
-            
-            keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data='back_to_menu')]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='HTML')
-            
-        except Exception as e:
-            error_message = f"❌ Ошибка при получении рекомендаций: {str(e)}"
-            keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data='back_to_menu')]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(error_message, reply_markup=reply_markup)
+        await self.show_recommendations(query, 'bonds', self.bonds_analyzer,
+                                        "🔍 Анализирую рынок облигаций...")
 
 async def main():
     """Основная функция запуска бота"""
@@ -323,13 +155,22 @@ async def main():
         bot = InvestmentAdvisorBot()
         print("✅ Объект бота создан")
         
+        # Снимки рынка обновляются в фоне, чтобы нажатия не ждали провайдеров
+        bot.start_background_refresh()
+        print("✅ Фоновое обновление снимков запущено")
+        
         # Создаем приложение
-        application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        # Обновления разных чатов обрабатываются параллельно, одного чата — по порядку
+        application = (Application.builder().token(TELEGRAM_BOT_TOKEN)
+                       .concurrent_updates(ChatOrderedUpdateProcessor()).build())
         print("✅ Приложение создано")
         
         # Добавляем обработчики
+        # Повторы обновлений отсеиваются до остальных обработчиков
+        add_dedup_handler(application)
         application.add_handler(CommandHandler("start", bot.start_command))
         application.add_handler(CallbackQueryHandler(bot.button_callback))
+        add_subscription_handlers(application)
         print("✅ Обработчики добавлены")
         
         print("🤖 Интерактивный бот-советник запущен!")
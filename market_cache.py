@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Двухуровневый кеш рыночных данных: разобранные снимки в памяти (TTL + LRU)
+поверх общего для всех процессов хранилища снимков на SQLite
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import MEMORY_CACHE_MAX_ENTRIES, MEMORY_CACHE_COHERENCE
+from snapshot_store import SnapshotStore, get_snapshot_store
+
+
+class MarketCache:
+    def __init__(self, prefix: str, max_entries: int = MEMORY_CACHE_MAX_ENTRIES,
+                 store: Optional[SnapshotStore] = None, coherence: float = MEMORY_CACHE_COHERENCE):
+        self.prefix = prefix
+        self.max_entries = max_entries
+        self.coherence = coherence
+        self.store = store or get_snapshot_store()
+        # key -> (версия, время публикации, данные); порядок — от давно использованных к недавним
+        self._memory: "OrderedDict[str, Tuple[int, float, Any]]" = OrderedDict()
+        # key -> когда запись в памяти последний раз сверялась с хранилищем (или была туда записана)
+        self._checked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def _store_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def _remember(self, key: str, entry: Tuple[int, float, Any]) -> None:
+        with self._lock:
+            current = self._memory.get(key)
+            # Версия 0 — свежие, но не опубликованные данные: они заменяют любую запись
+            if entry[0] and current is not None and current[0] > entry[0]:
+                return
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            self._checked[key] = time.time()
+            while len(self._memory) > self.max_entries:
+                evicted, _ = self._memory.popitem(last=False)
+                self._checked.pop(evicted, None)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def read(self, key: str, ttl_seconds: int = 900) -> List[Dict[str, Any]]:
+        """Возвращает данные не старше ttl_seconds или пустой список"""
+        return self.read_versioned(key, ttl_seconds)[1]
+
+    def read_versioned(self, key: str, ttl_seconds: int = 900) -> Tuple[int, List[Dict[str, Any]]]:
+        """Как read, но вместе с версией снимка (0 — снимка нет)"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            fresh = entry is not None and now - self._checked.get(key, 0.0) < self.coherence
+            if fresh and now - entry[1] <= ttl_seconds:
+                # Недавно сверенная запись: отдаем из памяти без обращения к хранилищу
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0], entry[2]
+        
+        try:
+            head = self.store.head(self._store_key(key))
+        except Exception as e:
+            print(f"Хранилище снимков недоступно: {e}")
+            head = None
+
+        with self._lock:
+            entry = self._memory.get(key)
+        if head is None and entry is None:
+            self._count('misses')
+            return 0, []
+
+        # Память годится, если другой процесс не опубликовал версию новее
+        if entry is not None and (head is None or head[0] <= entry[0]):
+            if time.time() - entry[1] > ttl_seconds:
+                self._count('misses')
+                return 0, []
+            with self._lock:
+                self._memory.move_to_end(key)
+                if head is not None:
+                    self._checked[key] = now
+            self._count('memory_hits')
+            return entry[0], entry[2]
+
+        if time.time() - head[1] > ttl_seconds:
+            self._count('misses')
+            return 0, []
+        try:
+            loaded = self.store.load(self._store_key(key))
+        except Exception as e:
+            print(f"Ошибка чтения снимка {key}: {e}")
+            loaded = None
+        if loaded is None:
+            self._count('misses')
+            return 0, []
+        self._remember(key, loaded)
+        self._count('store_hits')
+        return loaded[0], loaded[2]
+
+    def write(self, key: str, data: List[Dict[str, Any]]) -> int:
+        """Публикует новый снимок в хранилище и в память, возвращает его версию"""
+        try:
+            version = self.store.publish(self._store_key(key), data)
+        except Exception as e:
+            # Без хранилища снимок живет только в памяти процесса. Версия 0: старая версия
+            # указывала бы на прежние данные, и мемо с рендерером отдали бы устаревший результат
+            print(f"Не удалось опубликовать снимок {key}: {e}")
+            version = 0
+        self._remember(key, (version, time.time(), data))
+        return version
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'memory_hits': self.memory_hits,
+                'store_hits': self.store_hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+            }
+
+
+_caches: Dict[str, MarketCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_market_cache(prefix: str) -> MarketCache:
+    """Один кеш на префикс в процессе, общий для всех экземпляров анализаторов"""
+    with _caches_lock:
+        cache = _caches.get(prefix)
+        if cache is None:
+            cache = _caches[prefix] = MarketCache(prefix)
+        return cache
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """Счетчики попаданий и промахов по всем кешам процесса"""
+    with _caches_lock:
+        caches = dict(_caches)
+    return {prefix: cache.stats() for prefix, cache in caches.items()}
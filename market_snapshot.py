@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Колоночный снимок рынка для конвейера анализаторов
+Числовые поля лежат в array('d'), строковые — в списках интернированных строк.
+Фильтры и оценка работают по индексам; словари собираются только для итогового топа
+"""
+
+import sys
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+FLOAT = 'float'
+INT = 'int'
+TEXT = 'text'
+
+# Описание поля: (имя в строке результата, извлечение из исходной записи, тип)
+FieldSpec = Tuple[str, Callable[[Dict[str, Any]], Any], str]
+
+
+def number(value: Any) -> float:
+    """None и мусор превращаются в 0, как при .get(key, 0) в старых фильтрах"""
+    try:
+        return float(value) if value is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RowView:
+    """Легкое представление строки снимка с интерфейсом dict.get, без копирования данных"""
+    __slots__ = ('_snapshot', '_index')
+
+    def __init__(self, snapshot: 'MarketSnapshot', index: int):
+        self._snapshot = snapshot
+        self._index = index
+
+    def get(self, name: str, default: Any = None) -> Any:
+        column = self._snapshot.columns.get(name)
+        if column is None or self._index in self._snapshot.absent.get(name, ()):
+            # Как dict.get: поля не было в исходной записи
+            return default
+        value = column[self._index]
+        return int(value) if self._snapshot.kinds[name] == INT else value
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self._snapshot.columns:
+            raise KeyError(name)
+        return self.get(name)
+
+
+class MarketSnapshot:
+    def __init__(self, fields: Sequence[FieldSpec], version: int = 0):
+        self.fields = list(fields)
+        self.version = version
+        self.kinds: Dict[str, str] = {name: kind for name, _, kind in self.fields}
+        self.columns: Dict[str, Any] = {
+            name: ([] if kind == TEXT else array('d')) for name, _, kind in self.fields
+        }
+        # Индексы строк, где числового поля не было в исходной записи (в колонке стоит 0)
+        self.absent: Dict[str, Set[int]] = {}
+        self._size = 0
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]], fields: Sequence[FieldSpec],
+                     version: int = 0) -> 'MarketSnapshot':
+        """Строит снимок из записей провайдера за один проход (записи могут приходить потоком)"""
+        snapshot = cls(fields, version)
+        for record in records:
+            snapshot.append(record)
+        return snapshot
+
+    def append(self, record: Dict[str, Any]) -> None:
+        for name, extract, kind in self.fields:
+            value = extract(record)
+            if kind == TEXT:
+                self.columns[name].append(sys.intern(str(value or '')))
+            else:
+                if value is None:
+                    self.absent.setdefault(name, set()).add(self._size)
+                self.columns[name].append(number(value))
+        self._size += 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    def column(self, name: str) -> Any:
+        return self.columns[name]
+
+    def view(self, index: int) -> RowView:
+        return RowView(self, index)
+
+    def indices(self) -> Iterator[int]:
+        return iter(range(self._size))
+
+    def row(self, index: int) -> Dict[str, Any]:
+        """Собирает словарь строки (только для итоговых результатов)"""
+        result = {}
+        for name, _, kind in self.fields:
+            value = self.columns[name][index]
+            result[name] = int(value) if kind == INT else value
+        return result
+
+    def rows(self, indices: Iterable[int], scores: Optional[Dict[int, float]] = None) -> List[Dict[str, Any]]:
+        """Словари для выбранных строк, при необходимости с оценкой investment_score"""
+        result = []
+        for index in indices:
+            row = self.row(index)
+            if scores is not None:
+                row['investment_score'] = scores.get(index, 0.0)
+            result.append(row)
+        return result
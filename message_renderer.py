@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Единый рендерер сообщений с рекомендациями
+Тело сообщения строится один раз на версию снимка и дату, дальше отдается готовый HTML
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from config import DAILY_BUDGET
+
+INTERACTIVE = 'interactive'
+DAILY = 'daily'
+
+NO_DATA_INTERACTIVE = "❌ Не удалось получить рекомендации. Попробуйте позже."
+NO_DATA_DAILY = "❌ К сожалению, не удалось получить рекомендации. Попробуйте позже."
+
+DAILY_FOOTER = (
+    "💡 <b>ОБЩИЕ СОВЕТЫ:</b>\n"
+    "• Не вкладывайте больше, чем можете позволить себе потерять\n"
+    "• Диверсифицируйте портфель\n"
+    "• Проводите собственное исследование перед покупкой\n"
+    "• Рассматривайте это как долгосрочную инвестицию\n\n"
+    "⚠️ <b>ОТКАЗ ОТ ОТВЕТСТВЕННОСТИ:</b>\n"
+    "Это не финансовый совет. Всегда проводите собственное исследование."
+)
+
+# Заголовки: (эмодзи и название, подзаголовок списка)
+TITLES = {
+    'crypto': ("🪙 <b>РЕКОМЕНДАЦИИ ПО КРИПТОВАЛЮТАМ</b>", "🔍 <b>ТОП-3 КРИПТОВАЛЮТЫ:</b>"),
+    'stocks': ("📈 <b>РЕКОМЕНДАЦИИ ПО АКЦИЯМ</b>", "🔍 <b>ТОП-3 АКЦИИ:</b>"),
+    'bonds': ("💼 <b>РЕКОМЕНДАЦИИ ПО ОБЛИГАЦИЯМ</b>", "🔍 <b>ТОП-3 ОБЛИГАЦИИ:</b>"),
+}
+DAILY_TITLES = {
+    'crypto': ("🚀 <b>ЕЖЕДНЕВНЫЕ РЕКОМЕНДАЦИИ ПО КРИПТОВАЛЮТАМ</b>",
+               "🔍 <b>ТОП-3 КРИПТОВАЛЮТЫ ДЛЯ ПОКУПКИ:</b>"),
+}
+
+
+class RenderedMessage(NamedTuple):
+    text: str
+    digest: str
+
+
+def message_digest(text: str, extra: str = '') -> str:
+    """Хеш содержимого: одинаковый хеш — редактировать сообщение незачем"""
+    return hashlib.sha256((text + '\x00' + extra).encode('utf-8')).hexdigest()
+
+
+def crypto_reasons(coin: Dict[str, Any]) -> List[str]:
+    """Причины покупки криптовалюты"""
+    reasons = []
+    price = coin['current_price']
+    price_change = coin['price_change_24h']
+    price_change_7d = coin.get('price_change_7d', 0) or 0
+    rank = coin['market_cap_rank']
+    volume = coin['volume_24h']
+    market_cap = coin.get('market_cap', 0)
+
+    # Анализ цены
+    if 0 < price <= 0.1:
+        reasons.append(f"✅ Сверхдоступная цена - за $10 можно купить {int(10/price)} монет")
+    elif 0 < price <= 0.5:
+        reasons.append(f"✅ Очень доступная цена - за $10 можно купить {int(10/price)} монет")
+    elif 0 < price <= 1:
+        reasons.append(f"✅ Доступная цена - за $10 можно купить {int(10/price)} монет")
+    elif 0 < price <= 2:
+        reasons.append(f"✅ Умеренная цена - за $10 можно купить {int(10/price)} монет")
+
+    # Анализ изменения цены
+    if price_change <= -15:
+        reasons.append(f"✅ Сильная просадка (-{abs(price_change):.1f}%) - отличная возможность")
+    elif price_change <= -8:
+        reasons.append(f"✅ Значительное падение (-{abs(price_change):.1f}%) - хороший момент")
+    elif price_change <= -3:
+        reasons.append(f"✅ Небольшая коррекция (-{abs(price_change):.1f}%) - подходящее время")
+    elif price_change >= 15:
+        reasons.append(f"⚠️ Сильный рост (+{price_change:.1f}%) - тренд позитивный")
+    elif price_change >= 5:
+        reasons.append(f"✅ Позитивный тренд (+{price_change:.1f}%) - монета набирает силу")
+
+    # Анализ недельного тренда
+    if price_change_7d <= -20:
+        reasons.append(f"📉 Недельная просадка -{abs(price_change_7d):.1f}% - возможно дно")
+    elif price_change_7d >= 20:
+        reasons.append(f"📈 Недельный рост +{price_change_7d:.1f}% - сильный тренд")
+
+    # Анализ ранга
+    if rank <= 50:
+        reasons.append("🏆 Топ-50 проект - высокая стабильность")
+    elif rank <= 100:
+        reasons.append("🥈 Топ-100 проект - хороший баланс")
+    elif rank <= 200:
+        reasons.append("🥉 Топ-200 проект - перспективный рост")
+    elif rank <= 500:
+        reasons.append("💎 Топ-500 проект - высокий потенциал")
+
+    # Анализ ликвидности
+    if volume >= 100000000:
+        reasons.append("💧 Очень высокая ликвидность")
+    elif volume >= 50000000:
+        reasons.append("🌊 Высокая ликвидность")
+    elif volume >= 10000000:
+        reasons.append("💦 Хорошая ликвидность")
+    elif volume >= 5000000:
+        reasons.append("💧 Умеренная ликвидность")
+
+    # Анализ капитализации
+    if market_cap >= 1000000000:
+        reasons.append("💎 Крупная капитализация - низкий риск")
+    elif market_cap >= 100000000:
+        reasons.append("💎 Средняя капитализация - хороший потенциал")
+    elif market_cap >= 10000000:
+        reasons.append("💎 Малый проект - высокий риск, но большой потенциал")
+
+    return reasons
+
+
+def crypto_interactive_reasons(coin: Dict[str, Any]) -> List[str]:
+    """Причины покупки криптовалюты для кнопки в интерактивном боте (короче ежедневной версии)"""
+    reasons = []
+    price = coin['current_price']
+    price_change = coin['price_change_24h']
+    rank = coin['market_cap_rank']
+    volume = coin['volume_24h']
+
+    if 0 < price <= 0.1:
+        reasons.append(f"✅ Сверхдоступная цена - за $10 можно купить {int(10/price)} монет")
+    elif 0 < price <= 0.5:
+        reasons.append(f"✅ Очень доступная цена - за $10 можно купить {int(10/price)} монет")
+    elif 0 < price <= 1:
+        reasons.append(f"✅ Доступная цена - за $10 можно купить {int(10/price)} монет")
+    elif 0 < price <= 2:
+        reasons.append(f"✅ Умеренная цена - за $10 можно купить {int(10/price)} монет")
+
+    if price_change <= -15:
+        reasons.append(f"✅ Сильная просадка (-{abs(price_change):.1f}%) - отличная возможность")
+    elif price_change <= -8:
+        reasons.append(f"✅ Значительное падение (-{abs(price_change):.1f}%) - хороший момент")
+    elif price_change <= -3:
+        reasons.append(f"✅ Небольшая коррекция (-{abs(price_change):.1f}%) - подходящее время")
+    elif price_change >= 5:
+        reasons.append(f"✅ Позитивный тренд (+{price_change:.1f}%)")
+
+    if rank <= 100:
+        reasons.append("🥈 Топ-100 проект - хороший баланс")
+    elif rank <= 200:
+        reasons.append("🥉 Топ-200 проект - перспективный рост")
+
+    if volume >= 50000000:
+        reasons.append("🌊 Высокая ликвидность")
+    elif volume >= 10000000:
+        reasons.append("💦 Хорошая ликвидность")
+
+    return reasons
+
+
+def stock_reasons(stock: Dict[str, Any]) -> List[str]:
+    """Причины покупки акции"""
+    reasons = []
+    price = stock['current_price']
+    price_change = stock['price_change_24h']
+    volume = stock['volume_24h']
+    market_cap = stock.get('market_cap', 0)
+
+    if 0 < price <= 1:
+        reasons.append(f"✅ Очень доступная цена - за $10 можно купить {int(10/price)} акций")
+    elif 0 < price <= 5:
+        reasons.append(f"✅ Доступная цена - за $10 можно купить {int(10/price)} акций")
+    elif 0 < price <= 10:
+        reasons.append(f"✅ Умеренная цена - за $10 можно купить {int(10/price)} акций")
+
+    if price_change <= -10:
+        reasons.append(f"✅ Сильная просадка (-{abs(price_change):.1f}%) - отличная возможность")
+    elif price_change <= -5:
+        reasons.append(f"✅ Значительное падение (-{abs(price_change):.1f}%) - хороший момент")
+    elif price_change <= -2:
+        reasons.append(f"✅ Небольшая коррекция (-{abs(price_change):.1f}%) - подходящее время")
+
+    if market_cap >= 10000000000:  # 10B+
+        reasons.append("🏆 Крупная компания - высокая стабильность")
+    elif market_cap >= 1000000000:  # 1B+
+        reasons.append("🥈 Средняя компания - хороший баланс")
+
+    if volume >= 100000000:
+        reasons.append("🌊 Высокая ликвидность")
+
+    return reasons
+
+
+def bond_reasons(bond: Dict[str, Any]) -> List[str]:
+    """Причины покупки облигации"""
+    reasons = []
+    yield_rate = bond.get('yield', 0)
+    rating = bond.get('rating', '')
+    bond_type = bond.get('type', '')
+    price = bond.get('current_price', 100)
+
+    if yield_rate >= 5.0:
+        reasons.append(f"✅ Высокая доходность ({yield_rate:.2f}%)")
+    elif yield_rate >= 4.0:
+        reasons.append(f"✅ Хорошая доходность ({yield_rate:.2f}%)")
+
+    if rating in ['AAA', 'AA', 'AA+', 'AA-']:
+        reasons.append(f"🏆 Высокий рейтинг ({rating}) - низкий риск")
+    elif rating in ['A', 'A+', 'A-']:
+        reasons.append(f"🥈 Хороший рейтинг ({rating})")
+
+    if bond_type == 'Government':
+        reasons.append("🛡️ Государственная облигация - максимальная безопасность")
+    elif bond_type == 'Corporate':
+        reasons.append("💼 Корпоративная облигация - баланс риска и доходности")
+
+    if abs(price - 100) <= 2:
+        reasons.append("✅ Цена близка к номиналу - стабильность")
+
+    return reasons
+
+
+def _crypto_item(i: int, coin: Dict[str, Any], style: str) -> str:
+    item = f"<b>{i}. {coin['name']} ({coin['symbol']})</b>\n"
+    item += f"💰 Цена: ${coin['current_price']:.4f}\n"
+    item += f"📈 Изменение за 24ч: {coin['price_change_24h']:.1f}%\n"
+    item += f"🏆 Ранг: #{coin['market_cap_rank']}\n"
+    item += f"📊 Объем: ${coin['volume_24h']/1000000:.1f}M\n"
+    if style == DAILY:
+        item += f"💎 Капитализация: ${coin.get('market_cap', 0)/1000000:.1f}M\n\n"
+    return item
+
+
+def _stock_item(i: int, stock: Dict[str, Any], style: str) -> str:
+    item = f"<b>{i}. {stock['name']} ({stock['symbol']})</b>\n"
+    item += f"💰 Цена: ${stock['current_price']:.2f}\n"
+    item += f"📈 Изменение за 24ч: {stock['price_change_24h']:.1f}%\n"
+    item += f"📊 Объем: ${stock['volume_24h']/1000000:.1f}M\n"
+    item += f"💎 Капитализация: ${stock['market_cap']/1000000000:.1f}B\n"
+    return item
+
+
+def _bond_item(i: int, bond: Dict[str, Any], style: str) -> str:
+    item = f"<b>{i}. {bond['name']} ({bond['symbol']})</b>\n"
+    item += f"💰 Цена: ${bond['current_price']:.2f}\n"
+    item += f"📈 Доходность: {bond['yield']:.2f}%\n"
+    item += f"📅 Погашение: {bond['maturity']}\n"
+    item += f"🏆 Рейтинг: {bond['rating']}\n"
+    item += f"📊 Тип: {bond['type']}\n"
+    item += f"📈 Изменение за 24ч: {bond['price_change_24h']:.2f}%\n"
+    return item
+
+
+ITEM_RENDERERS: Dict[str, Tuple[Callable[[int, Dict[str, Any], str], str],
+                                Callable[[Dict[str, Any]], List[str]]]] = {
+    'crypto': (_crypto_item, crypto_reasons),
+    'stocks': (_stock_item, stock_reasons),
+    'bonds': (_bond_item, bond_reasons),
+}
+
+# Причины, которые в интерактивном боте отличаются от ежедневной рассылки
+INTERACTIVE_REASONS: Dict[str, Callable[[Dict[str, Any]], List[str]]] = {
+    'crypto': crypto_interactive_reasons,
+}
+
+
+class RecommendationRenderer:
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._bodies: "OrderedDict[Tuple[str, str, int, str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, asset_class: str, style: str, version: int,
+               recommendations: List[Dict[str, Any]], now: datetime) -> RenderedMessage:
+        """Готовое HTML-сообщение; тело берется из кеша по версии снимка, содержимому и дате"""
+        date_str = now.strftime("%d.%m.%Y")
+        text = self._header(asset_class, style, date_str, now) + \
+            self._body(asset_class, style, version, date_str, recommendations)
+        return RenderedMessage(text, message_digest(text))
+
+    def _header(self, asset_class: str, style: str, date_str: str, now: datetime) -> str:
+        if style == DAILY:
+            title, subtitle = DAILY_TITLES[asset_class]
+            header = f"{title}\n"
+            header += f"📅 Дата: {date_str}\n"
+            header += f"💰 Бюджет на день: ${DAILY_BUDGET}\n"
+            header += f"⏰ Время анализа: {now.strftime('%H:%M')}\n\n"
+        else:
+            title, subtitle = TITLES[asset_class]
+            header = f"{title}\n"
+            header += f"📅 Дата: {date_str}\n"
+            header += f"💰 Бюджет: ${DAILY_BUDGET}\n\n"
+        return header + f"{subtitle}\n\n"
+
+    def _body(self, asset_class: str, style: str, version: int, date_str: str,
+              recommendations: List[Dict[str, Any]]) -> str:
+        # Версия снимка не меняется при перезагрузке правил оценки, поэтому
+        # в ключ входит и хеш самих рекомендаций
+        key = (asset_class, style, version, message_digest(repr(recommendations)), date_str)
+        if version:
+            with self._lock:
+                body = self._bodies.get(key)
+                if body is not None:
+                    self._bodies.move_to_end(key)
+                    self.hits += 1
+                    return body
+
+        body = self._build_body(asset_class, style, recommendations)
+        if version:
+            with self._lock:
+                self.misses += 1
+                self._bodies[key] = body
+                while len(self._bodies) > self.max_entries:
+                    self._bodies.popitem(last=False)
+        return body
+
+    def _build_body(self, asset_class: str, style: str, recommendations: List[Dict[str, Any]]) -> str:
+        if not recommendations:
+            return NO_DATA_DAILY if style == DAILY else NO_DATA_INTERACTIVE
+
+        render_item, reasons_for = ITEM_RENDERERS[asset_class]
+        if style == INTERACTIVE:
+            reasons_for = INTERACTIVE_REASONS.get(asset_class, reasons_for)
+        parts = []
+        for i, asset in enumerate(recommendations, 1):
+            item = render_item(i, asset, style)
+            reasons = reasons_for(asset)
+            # Показываем топ-3 причины
+            if reasons:
+                item += f"🤔 Почему купить: {', '.join(reasons[:3])}\n"
+            elif style == DAILY:
+                item += "🤔 Почему купить: Сбалансированные показатели\n"
+            parts.append(item + "\n")
+
+        if style == DAILY:
+            parts.append(DAILY_FOOTER)
+        return ''.join(parts)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._bodies)}
+
+
+_renderer: Optional[RecommendationRenderer] = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer() -> RecommendationRenderer:
+    """Общий рендерер процесса"""
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                _renderer = RecommendationRenderer()
+    return _renderer
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Ограничение частоты запросов к провайдерам (token bucket по хостам)
+Состояние бакетов лежит в SQLite, поэтому лимит общий для всех процессов на машине:
+воркеров gunicorn, планировщика и интерактивного бота
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+from config import (PROVIDER_RATE_LIMITS, RATE_LIMIT_DB_PATH, RATE_LIMIT_MAX_WAIT,
+                    RATE_LIMIT_DEFAULT_PENALTY)
+
+
+class RateLimitExceeded(Exception):
+    """Разрешение на запрос не получено за RATE_LIMIT_MAX_WAIT секунд"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает заголовок Retry-After (секунды или HTTP-дата) в секунды ожидания"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostRateLimiter:
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 db_path: str = RATE_LIMIT_DB_PATH,
+                 max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.limits = PROVIDER_RATE_LIMITS if limits is None else limits
+        self.db_path = db_path
+        self.max_wait = max_wait
+        self._local = threading.local()
+        self._disabled = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """Отдельное соединение на поток; таблица создается при первом обращении"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                'host TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+                'updated_at REAL NOT NULL, blocked_until REAL NOT NULL DEFAULT 0)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def _try_take(self, host: str, rate: float, burst: int) -> float:
+        """Пытается забрать токен; возвращает 0 при успехе или сколько секунд подождать"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute(
+                'SELECT tokens, updated_at, blocked_until FROM buckets WHERE host = ?', (host,)
+            ).fetchone()
+            if row is None:
+                tokens, blocked_until = float(burst), 0.0
+            else:
+                tokens = min(float(burst), row[0] + max(0.0, now - row[1]) * rate)
+                blocked_until = row[2]
+
+            if blocked_until > now:
+                wait = blocked_until - now
+            elif tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+
+            conn.execute(
+                'INSERT OR REPLACE INTO buckets (host, tokens, updated_at, blocked_until) '
+                'VALUES (?, ?, ?, ?)', (host, tokens, now, blocked_until)
+            )
+            conn.execute('COMMIT')
+            return wait
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def acquire(self, host: str) -> None:
+        """Ждет разрешения на запрос к хосту (хосты без лимита проходят сразу)"""
+        if host not in self.limits or self._disabled:
+            return
+        rate, burst = self.limits[host]
+        deadline = time.time() + self.max_wait
+        while True:
+            try:
+                wait = self._try_take(host, rate, burst)
+            except sqlite3.Error as e:
+                # Без общего хранилища лимит не соблюсти, но и блокировать запросы не стоит
+                print(f"Лимитер запросов недоступен, работаем без него: {e}")
+                self._disabled = True
+                return
+            if wait <= 0:
+                return
+            if time.time() + wait > deadline:
+                raise RateLimitExceeded(f"{host}: лимит запросов исчерпан, ждать {wait:.1f} с")
+            time.sleep(wait)
+
+    def penalize(self, host: str, retry_after: Optional[float] = None) -> None:
+        """Блокирует хост после 429: учитывает Retry-After и обнуляет бакет"""
+        if host not in self.limits or self._disabled:
+            return
+        pause = RATE_LIMIT_DEFAULT_PENALTY if retry_after is None else retry_after
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                'INSERT INTO buckets (host, tokens, updated_at, blocked_until) VALUES (?, 0, ?, ?) '
+                'ON CONFLICT(host) DO UPDATE SET tokens = 0, updated_at = excluded.updated_at, '
+                'blocked_until = MAX(blocked_until, excluded.blocked_until)',
+                (host, now, now + pause)
+            )
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            print(f"Не удалось сохранить паузу для {host}: {e}")
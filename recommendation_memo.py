@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Мемоизация готовых топ-N рекомендаций по версии снимка и параметрам фильтров
+Новая версия снимка автоматически делает старую запись недействительной
+"""
+
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class RecommendationMemo:
+    def __init__(self):
+        # key -> (версия снимка, результат)
+        self._entries: Dict[Hashable, Tuple[int, List[Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: int) -> Optional[List[Dict[str, Any]]]:
+        """Результат для этой версии снимка или None"""
+        if not version:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.hits += 1
+        # Копии, чтобы вызывающий код не испортил общий результат
+        return [dict(item) for item in entry[1]]
+
+    def put(self, key: Hashable, version: int, result: List[Dict[str, Any]]) -> None:
+        """Запоминает результат; снимки без версии (резервные данные) не кешируются"""
+        if not version:
+            return
+        with self._lock:
+            current = self._entries.get(key)
+            if current is None or current[0] <= version:
+                self._entries[key] = (version, [dict(item) for item in result])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+_memo: Optional[RecommendationMemo] = None
+_memo_lock = threading.Lock()
+
+
+def get_recommendation_memo() -> RecommendationMemo:
+    """Общая мемоизация рекомендаций процесса"""
+    global _memo
+    if _memo is None:
+        with _memo_lock:
+            if _memo is None:
+                _memo = RecommendationMemo()
+    return _memo
@@ -1,19 +1,32 @@
 #!/usr/bin/env python3
 """
 Версия интерактивного бота для Render Web Service с Webhook
+ASGI-приложение (Starlette + uvicorn): webhook проверяет обновление, кладет его
+в ограниченную очередь и сразу отвечает 200, а пул обработчиков разбирает очередь
 """
 
 import asyncio
+import contextlib
 import os
 import logging
-import threading
-import time
 from datetime import datetime
-from flask import Flask, jsonify, request
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
 from telegram import Update
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler
 from interactive_bot import InvestmentAdvisorBot
-from config import TELEGRAM_BOT_TOKEN
+from asset_pipeline import pipeline_stats
+from market_cache import cache_stats
+from recommendation_memo import get_recommendation_memo
+from single_flight import get_single_flight
+from update_dedup import get_update_deduplicator
+from executors import shutdown_analyzer_executor
+from http_client import close_provider_client
+from broadcast import add_subscription_handlers, get_subscriber_registry
+from update_processor import ChatOrderedUpdateProcessor, dispatch_updates
+from config import TELEGRAM_BOT_TOKEN, WEBHOOK_QUEUE_SIZE, WEBHOOK_RETRY_AFTER, WEBHOOK_SECRET_TOKEN
 
 # Настройка логирования
 logging.basicConfig(
@@ -22,23 +35,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Создаем Flask приложение для Render
-app = Flask(__name__)
-
 # Глобальные переменные
 bot_application = None
 investment_bot = None
 bot_initialized = False
-init_lock = threading.Lock()
+init_lock = None
+# Очередь обновлений и ее разборщик создаются при старте приложения
+update_queue = None
+update_dispatcher = None
+updates_rejected = 0
 
-def initialize_bot():
-    """Инициализация бота (синхронно, без async)"""
-    global bot_application, investment_bot, bot_initialized
+async def initialize_bot():
+    """Инициализация бота: Application создается и инициализируется один раз на процесс"""
+    global bot_application, investment_bot, bot_initialized, update_dispatcher
     
     if bot_initialized:
         return True
     
-    with init_lock:
+    async with init_lock:
         if bot_initialized:
             return True
         
@@ -50,18 +64,30 @@ def initialize_bot():
             logger.info("🚀 Начало инициализации интерактивного бота...")
             logger.info(f"🔑 Токен получен: {TELEGRAM_BOT_TOKEN[:20]}...")
             
-            logger.info("📦 Создание InvestmentAdvisorBot...")
-            investment_bot = InvestmentAdvisorBot()
-            logger.info("✅ InvestmentAdvisorBot создан")
+            if investment_bot is None:
+                logger.info("📦 Создание InvestmentAdvisorBot...")
+                investment_bot = InvestmentAdvisorBot()
+                investment_bot.start_background_refresh()
+                logger.info("✅ InvestmentAdvisorBot создан, фоновое обновление снимков запущено")
+            
+            if bot_application is None:
+                logger.info("📦 Создание Application...")
+                # Обновления разных чатов обрабатываются параллельно, одного чата — по порядку
+                bot_application = (Application.builder().token(TELEGRAM_BOT_TOKEN)
+                                   .concurrent_updates(ChatOrderedUpdateProcessor()).build())
+                bot_application.add_handler(CommandHandler("start", investment_bot.start_command))
+                bot_application.add_handler(CallbackQueryHandler(investment_bot.button_callback))
+                add_subscription_handlers(bot_application)
+                logger.info("✅ Application создан, обработчики добавлены")
             
-            logger.info("📦 Создание Application...")
-            bot_application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-            logger.info("✅ Application создан")
+            # HTTP-клиент и get_me — один раз, Application живет до остановки процесса
+            await bot_application.initialize()
             
-            logger.info("📦 Добавление обработчиков...")
-            bot_application.add_handler(CommandHandler("start", investment_bot.start_command))
-            bot_application.add_handler(CallbackQueryHandler(investment_bot.button_callback))
-            logger.info("✅ Обработчики добавлены")
+            # Обновления из очереди обрабатываются в фоне, после ответа Telegram; порядок внутри
+            # чата и общую параллельность обеспечивает update_processor приложения
+            if update_queue is not None and update_dispatcher is None:
+                update_dispatcher = asyncio.create_task(dispatch_updates(
+                    update_queue, bot_application.update_processor, bot_application.process_update))
             
             bot_initialized = True
             logger.info("✅✅✅ Бот полностью инициализирован и готов к работе через webhook")
@@ -74,116 +100,134 @@ def initialize_bot():
             bot_initialized = False
             return False
 
-# Инициализируем бота при импорте модуля
-logger.info("=" * 60)
-logger.info("🚀 НАЧАЛО ИНИЦИАЛИЗАЦИИ БОТА ПРИ СТАРТЕ ПРИЛОЖЕНИЯ")
-logger.info("=" * 60)
-initialize_bot()
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Старт и остановка: инициализация бота, запуск и остановка разбора очереди"""
+    global init_lock, update_queue
+    logger.info("=" * 60)
+    logger.info("🚀 НАЧАЛО ИНИЦИАЛИЗАЦИИ БОТА ПРИ СТАРТЕ ПРИЛОЖЕНИЯ")
+    logger.info("=" * 60)
+    init_lock = asyncio.Lock()
+    update_queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+    await initialize_bot()
+    
+    try:
+        yield
+    finally:
+        # Даем дообработать принятые обновления
+        try:
+            await asyncio.wait_for(update_queue.join(), timeout=10)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ При остановке в очереди осталось {update_queue.qsize()} обновлений")
+        if update_dispatcher is not None:
+            update_dispatcher.cancel()
+            await asyncio.gather(update_dispatcher, return_exceptions=True)
+        if bot_initialized:
+            await bot_application.shutdown()
+        shutdown_analyzer_executor()
+        close_provider_client()
+
+def webhook_url_for(request):
+    """URL webhook из WEBHOOK_URL или из заголовков запроса"""
+    webhook_url = os.environ.get('WEBHOOK_URL')
+    if not webhook_url:
+        # Если не указан в переменных окружения, формируем из request
+        scheme = request.headers.get('X-Forwarded-Proto', 'https')
+        host = request.headers.get('Host', request.url.netloc)
+        webhook_url = f"{scheme}://{host}/webhook"
+    return webhook_url
 
-# Flask маршруты
-@app.route('/')
-def home():
-    status = initialize_bot()
-    return jsonify({
+# Маршруты
+async def home(request):
+    await initialize_bot()
+    return JSONResponse({
         "status": "Investment Advisor Bot is running",
         "time": datetime.now().isoformat(),
         "message": "Bot is active and ready for user interactions via webhook",
-        "webhook_url": os.environ.get('WEBHOOK_URL', request.url_root + 'webhook'),
+        "webhook_url": os.environ.get('WEBHOOK_URL', str(request.base_url) + 'webhook'),
         "bot_initialized": bot_initialized
     })
 
-@app.route('/health')
-def health():
-    status = initialize_bot()
-    return jsonify({
+async def health(request):
+    await initialize_bot()
+    return JSONResponse({
         "status": "healthy",
         "bot_initialized": bot_initialized,
-        "bot_application_exists": bot_application is not None
+        "bot_application_exists": bot_application is not None,
+        "update_queue": {
+            "size": update_queue.qsize() if update_queue is not None else 0,
+            "capacity": WEBHOOK_QUEUE_SIZE,
+            "rejected": updates_rejected,
+            "processing": bot_application.update_processor.stats() if bot_application is not None else None
+        },
+        "cache": cache_stats(),
+        "recommendations_memo": get_recommendation_memo().stats(),
+        "pipeline": pipeline_stats(),
+        "single_flight": get_single_flight().stats(),
+        "update_dedup": get_update_deduplicator().stats(),
+        "subscribers": await asyncio.to_thread(lambda: get_subscriber_registry().stats())
     })
 
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    """Webhook endpoint для получения обновлений от Telegram"""
-    if not initialize_bot():
+async def webhook(request: Request):
+    """Webhook endpoint для получения обновлений от Telegram: проверка, постановка в очередь, ответ"""
+    global updates_rejected
+    if not await initialize_bot():
         logger.error("❌ Бот не инициализирован для обработки webhook")
-        return jsonify({"status": "error", "message": "Bot not initialized"}), 500
+        return JSONResponse({"status": "error", "message": "Bot not initialized"}, status_code=500)
     
-    if bot_application is None:
-        logger.error("❌ Bot application не создан для обработки webhook")
-        return jsonify({"status": "error", "message": "Bot application not created"}), 500
+    if WEBHOOK_SECRET_TOKEN and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET_TOKEN:
+        logger.warning("⚠️ Webhook-запрос с неверным секретом")
+        return JSONResponse({"status": "error", "message": "Forbidden"}, status_code=403)
     
     try:
-        # Получаем JSON данные
-        json_data = request.get_json(force=True)
-        logger.info(f"📨 Получено обновление: {json_data.get('update_id', 'unknown')}")
-        
-        # Создаем Update из JSON
+        json_data = await request.json()
+        if not isinstance(json_data, dict) or not isinstance(json_data.get('update_id'), int):
+            raise ValueError("нет update_id")
         update = Update.de_json(json_data, bot_application.bot)
-        
-        # Обрабатываем обновление в новом event loop
-        # Используем asyncio.run() для каждого обновления
-        async def process_update_async():
-            """Обрабатывает обновление асинхронно"""
-            try:
-                # Инициализируем Application через контекстный менеджер
-                async with bot_application:
-                    # Обрабатываем обновление
-                    await bot_application.process_update(update)
-            except Exception as e:
-                logger.error(f"❌ Ошибка обработки обновления: {e}")
-                import traceback
-                traceback.print_exc()
-                raise
-        
-        # Запускаем обработку обновления
-        asyncio.run(process_update_async())
-        
-        return jsonify({"status": "ok"})
     except Exception as e:
-        logger.error(f"❌ Ошибка обработки webhook: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"status": "error", "message": str(e)}), 500
+        # Тело не похоже на обновление Telegram: в очередь не ставим
+        logger.error(f"❌ Некорректное обновление: {e}")
+        return JSONResponse({"status": "error", "message": "Bad update"}, status_code=400)
+    
+    # Повторная доставка (Telegram не дождался ответа) не должна запускать обработку еще раз
+    deduplicator = get_update_deduplicator()
+    if await deduplicator.aseen(update.update_id):
+        logger.info(f"♻️ Повтор обновления {update.update_id} пропущен")
+        return JSONResponse({"status": "duplicate"})
+    
+    try:
+        update_queue.put_nowait(update)
+    except asyncio.QueueFull:
+        # Обратное давление: Telegram повторит доставку позже, поэтому снимаем отметку
+        await deduplicator.aforget(update.update_id)
+        updates_rejected += 1
+        logger.warning(f"⚠️ Очередь обновлений заполнена, {update.update_id} отклонено")
+        return JSONResponse({"status": "busy"}, status_code=503,
+                            headers={"Retry-After": str(WEBHOOK_RETRY_AFTER)})
+    
+    logger.info(f"📨 Получено обновление: {update.update_id}")
+    return JSONResponse({"status": "ok"})
 
-@app.route('/set-webhook', methods=['GET', 'POST'])
-def set_webhook():
+async def set_webhook(request):
     """Устанавливает webhook для бота"""
-    if not initialize_bot():
+    if not await initialize_bot():
         logger.error("❌ Бот не инициализирован для установки webhook")
-        return jsonify({
+        return JSONResponse({
             "status": "error",
             "message": "Bot not initialized",
             "bot_initialized": bot_initialized,
             "bot_application_exists": bot_application is not None
-        }), 500
-    
-    if bot_application is None:
-        logger.error("❌ Bot application не создан для установки webhook")
-        return jsonify({"status": "error", "message": "Bot application not created"}), 500
+        }, status_code=500)
     
     try:
-        # Получаем URL для webhook
-        webhook_url = os.environ.get('WEBHOOK_URL')
-        if not webhook_url:
-            # Если не указан в переменных окружения, формируем из request
-            scheme = request.headers.get('X-Forwarded-Proto', 'https')
-            host = request.headers.get('Host', request.host)
-            webhook_url = f"{scheme}://{host}/webhook"
-        
+        webhook_url = webhook_url_for(request)
         logger.info(f"🔗 Установка webhook: {webhook_url}")
         
-        # Устанавливаем webhook асинхронно
-        async def set_webhook_async():
-            """Устанавливает webhook асинхронно"""
-            async with bot_application:
-                result = await bot_application.bot.set_webhook(webhook_url)
-                return result
-        
-        result = asyncio.run(set_webhook_async())
+        result = await bot_application.bot.set_webhook(webhook_url, secret_token=WEBHOOK_SECRET_TOKEN or None)
         
         logger.info(f"✅ Webhook установлен: {result}")
         
-        return jsonify({
+        return JSONResponse({
             "status": "success",
             "message": "Webhook установлен",
             "url": webhook_url,
@@ -193,31 +237,36 @@ def set_webhook():
         logger.error(f"❌ Ошибка установки webhook: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
 
-@app.route('/delete-webhook', methods=['GET'])
-def delete_webhook():
+async def delete_webhook(request):
     """Удаляет webhook (для тестирования)"""
-    if not initialize_bot():
-        return jsonify({"status": "error", "message": "Bot not initialized"}), 500
+    if not await initialize_bot():
+        return JSONResponse({"status": "error", "message": "Bot not initialized"}, status_code=500)
     
     try:
-        async def delete_webhook_async():
-            """Удаляет webhook асинхронно"""
-            async with bot_application:
-                result = await bot_application.bot.delete_webhook()
-                return result
-        
-        result = asyncio.run(delete_webhook_async())
+        result = await bot_application.bot.delete_webhook()
         
-        return jsonify({
+        return JSONResponse({
             "status": "success",
             "message": "Webhook удален",
             "result": result
         })
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+app = Starlette(
+    routes=[
+        Route('/', home),
+        Route('/health', health),
+        Route('/webhook', webhook, methods=['POST']),
+        Route('/set-webhook', set_webhook, methods=['GET', 'POST']),
+        Route('/delete-webhook', delete_webhook, methods=['GET']),
+    ],
+    lifespan=lifespan
+)
 
 if __name__ == "__main__":
+    import uvicorn
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
+    uvicorn.run(app, host='0.0.0.0', port=port)
@@ -41,6 +41,7 @@ async def main():
         # Импортируем и запускаем бота с детальными рекомендациями
         from send_detailed_message import send_detailed_recommendations
         from telegram_bot import CryptoAdvisorBot
+        from async_scheduler import AsyncScheduler
         
         # Создаем экземпляр бота
         bot = CryptoAdvisorBot()
@@ -54,25 +55,26 @@ async def main():
         await send_detailed_recommendations()
         
         # Настраиваем ежедневные уведомления
-        bot.schedule_daily_notifications()
+        scheduler = AsyncScheduler()
+        bot.schedule_daily_notifications(scheduler)
         
         print("🤖 Бот запущен! Ожидание ежедневных уведомлений...")
         print("📅 Уведомления будут отправляться каждый день в 10:00")
         print("💡 Для получения рекомендаций сейчас запустите: python3 send_detailed_message.py")
         
         # Запускаем планировщик
-        import schedule
-        import time
-        
-        while True:
-            schedule.run_pending()
-            await asyncio.sleep(60)  # Проверяем каждую минуту
+        await scheduler.run()
             
     except KeyboardInterrupt:
         print("\n👋 Бот остановлен пользователем")
     except Exception as e:
         print(f"\n❌ Ошибка запуска: {e}")
         print("Попробуйте запустить тест: python3 test_bot.py")
+    finally:
+        from executors import shutdown_analyzer_executor
+        from http_client import close_provider_client
+        shutdown_analyzer_executor()
+        close_provider_client()
 
 if __name__ == "__main__":
     asyncio.run(main())
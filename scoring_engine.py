@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Векторная оценка привлекательности для целого снимка рынка
+Правила из scoring_rules компилируются в функции над массивами NumPy
+вместо цикла по активам
+"""
+
+from typing import Any, Callable, Optional, Sequence
+import numpy as np
+from market_snapshot import MarketSnapshot
+
+VectorRule = Callable[[MarketSnapshot, Optional[Sequence[int]]], np.ndarray]
+
+
+def column(snapshot: MarketSnapshot, name: str, indices: Optional[Sequence[int]] = None) -> np.ndarray:
+    """Числовая колонка снимка как массив без копирования (копия только при выборке индексов)"""
+    values = np.frombuffer(snapshot.column(name), dtype=np.float64)
+    if indices is None:
+        return values
+    return values[np.asarray(indices, dtype=np.intp)]
+
+
+def absent(snapshot: MarketSnapshot, name: str, indices: Optional[Sequence[int]] = None) -> np.ndarray:
+    """Маска строк, где поля не было в исходной записи"""
+    rows = snapshot.absent.get(name)
+    size = len(snapshot) if indices is None else len(indices)
+    if not rows:
+        return np.zeros(size, dtype=bool)
+    if indices is None:
+        mask = np.zeros(size, dtype=bool)
+        mask[np.fromiter(rows, dtype=np.intp, count=len(rows))] = True
+        return mask
+    return np.fromiter((index in rows for index in indices), dtype=bool, count=size)
+
+
+def compile_vectorized(rule: Any) -> VectorRule:
+    """
+    Векторная функция правила (scoring_rules.Rule): снимок -> взвешенные баллы строк
+    Операции и их порядок те же, что в скалярной версии, чтобы результаты совпадали побитово
+    """
+    field, weight = rule.field, rule.weight
+    
+    if rule.lookup is not None:
+        lookup, default = rule.lookup, rule.default
+        
+        def evaluate_lookup(snapshot: MarketSnapshot, indices: Optional[Sequence[int]] = None) -> np.ndarray:
+            values = snapshot.column(field)
+            if indices is not None:
+                values = [values[i] for i in indices]
+            # Строки интернированы, различных значений мало — балл считаем по каждому один раз
+            points = {value: lookup.get(value, default) for value in set(values)}
+            return np.array([points[value] for value in values], dtype=np.float64) * weight
+        
+        return evaluate_lookup
+    
+    if rule.linear is not None:
+        offset, coef, divisor = rule.linear['offset'], rule.linear['coef'], rule.linear['divisor']
+        low, high = rule.linear.get('min'), rule.linear.get('max')
+        
+        def points(values: np.ndarray) -> np.ndarray:
+            result = offset + coef * (values / divisor)
+            if low is not None:
+                result = np.maximum(low, result)
+            if high is not None:
+                result = np.minimum(high, result)
+            return result
+    else:
+        bands, default = rule.bands, rule.default
+        
+        def points(values: np.ndarray) -> np.ndarray:
+            conditions = []
+            for low, high, _ in bands:
+                condition = np.ones(values.shape[0], dtype=bool)
+                if low is not None:
+                    condition &= values >= low
+                if high is not None:
+                    condition &= values <= high
+                conditions.append(condition)
+            return np.select(conditions, [band_score for _, _, band_score in bands], default)
+    
+    only_positive, distance_from, missing = rule.only_positive, rule.distance_from, rule.missing
+    
+    def evaluate(snapshot: MarketSnapshot, indices: Optional[Sequence[int]] = None) -> np.ndarray:
+        values = column(snapshot, field, indices)
+        if missing is not None and snapshot.absent.get(field):
+            values = np.where(absent(snapshot, field, indices), missing, values)
+        gate = values > 0 if only_positive else None
+        if distance_from is not None:
+            values = np.abs(values - distance_from)
+        weighted = points(values) * weight
+        return np.where(gate, weighted, 0.0) if gate is not None else weighted
+    
+    return evaluate
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Декларативные правила оценки активов
+Веса и пороги лежат в scoring_rules.json; при загрузке каждое правило компилируется
+в скалярную функцию (для одной записи) и векторную (для всего снимка).
+Файл перечитывается при изменении mtime, без перезапуска бота
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from config import SCORING_RULES_PATH, SCORING_RULES_CHECK_INTERVAL
+from market_snapshot import MarketSnapshot
+from scoring_engine import compile_vectorized
+
+
+class Rule(NamedTuple):
+    """Одно слагаемое оценки: weight * балл(field)"""
+    field: str
+    weight: float
+    # Слагаемое учитывается только при значении > 0
+    only_positive: bool = False
+    # Балл считается от |value - distance_from|
+    distance_from: Optional[float] = None
+    # offset + coef * (value / divisor), затем ограничение min/max
+    linear: Optional[Dict[str, float]] = None
+    # Первая полоса с min <= value <= max дает балл; границы необязательны
+    bands: Optional[List[Tuple[Optional[float], Optional[float], float]]] = None
+    # Балл по строковому значению
+    lookup: Optional[Dict[str, float]] = None
+    default: float = 0
+    # Значение поля, если его нет в записи (по умолчанию 0)
+    missing: Optional[float] = None
+
+
+def parse_rule(spec: Dict[str, Any]) -> Rule:
+    """Проверяет и нормализует описание правила из JSON"""
+    kinds = [kind for kind in ('linear', 'bands', 'lookup') if kind in spec]
+    if len(kinds) != 1:
+        raise ValueError(f"Правило {spec.get('field')!r}: нужен ровно один из linear/bands/lookup")
+    if 'field' not in spec or 'weight' not in spec:
+        raise ValueError(f"Правило без field/weight: {spec}")
+    
+    linear = None
+    if 'linear' in spec:
+        linear = {'offset': 0.0, 'coef': 1.0, 'divisor': 1.0, **spec['linear']}
+        if not linear['divisor']:
+            raise ValueError(f"Правило {spec['field']!r}: divisor не может быть 0")
+    bands = None
+    if 'bands' in spec:
+        bands = [(band.get('min'), band.get('max'), float(band['score'])) for band in spec['bands']]
+        if not bands:
+            raise ValueError(f"Правило {spec['field']!r}: пустой список bands")
+    lookup = {str(key): float(value) for key, value in spec['lookup'].items()} if 'lookup' in spec else None
+    
+    return Rule(
+        field=spec['field'],
+        weight=float(spec['weight']),
+        only_positive=bool(spec.get('only_positive', False)),
+        distance_from=spec.get('distance_from'),
+        linear=linear,
+        bands=bands,
+        lookup=lookup,
+        default=float(spec.get('default', 0)),
+        missing=float(spec['missing']) if spec.get('missing') is not None else None,
+    )
+
+
+def compile_scalar(rule: Rule) -> Callable[[Any], Optional[float]]:
+    """
+    Скалярная функция правила: запись -> взвешенный балл (None — слагаемое пропускается)
+    Ветвление по типу правила происходит здесь, а не на каждом активе
+    """
+    field, weight, distance_from = rule.field, rule.weight, rule.distance_from
+    
+    if rule.lookup is not None:
+        lookup, default = rule.lookup, rule.default
+        return lambda row: lookup.get(row.get(field, ''), default) * weight
+    
+    if rule.linear is not None:
+        offset, coef, divisor = rule.linear['offset'], rule.linear['coef'], rule.linear['divisor']
+        low, high = rule.linear.get('min'), rule.linear.get('max')
+        
+        def points(value: float) -> float:
+            result = offset + coef * (value / divisor)
+            if low is not None:
+                result = max(low, result)
+            if high is not None:
+                result = min(high, result)
+            return result
+    else:
+        bands, default = rule.bands, rule.default
+        
+        def points(value: float) -> float:
+            for low, high, band_score in bands:
+                if (low is None or value >= low) and (high is None or value <= high):
+                    return band_score
+            return default
+    
+    only_positive = rule.only_positive
+    missing = rule.missing if rule.missing is not None else 0
+    
+    def evaluate(row: Any) -> Optional[float]:
+        value = row.get(field)
+        if value is None:
+            value = missing
+        if only_positive and not value > 0:
+            return None
+        if distance_from is not None:
+            value = abs(value - distance_from)
+        return points(value) * weight
+    
+    return evaluate
+
+
+class CompiledScorer:
+    """Скомпилированный набор правил одного класса активов"""
+    
+    def __init__(self, asset_class: str, rules: Sequence[Rule], version: str):
+        self.asset_class = asset_class
+        self.rules = list(rules)
+        self.version = version
+        self._scalar = [compile_scalar(rule) for rule in self.rules]
+        self._vectorized = [compile_vectorized(rule) for rule in self.rules]
+    
+    def score(self, row: Any) -> float:
+        """Оценка одной записи (dict или строка снимка)"""
+        score = 0.0
+        for evaluate in self._scalar:
+            points = evaluate(row)
+            if points is not None:
+                score += points
+        return score
+    
+    def score_snapshot(self, snapshot: MarketSnapshot, indices: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Оценки строк снимка; порядок сложения тот же, что в score, результаты совпадают побитово"""
+        size = len(snapshot) if indices is None else len(indices)
+        score = np.zeros(size)
+        for evaluate in self._vectorized:
+            score += evaluate(snapshot, indices)
+        return score
+
+
+def compile_rules(raw: bytes) -> Dict[str, CompiledScorer]:
+    """Разбирает и компилирует файл правил; версия — хеш содержимого"""
+    version = hashlib.sha256(raw).hexdigest()[:12]
+    spec = json.loads(raw.decode('utf-8'))
+    return {
+        asset_class: CompiledScorer(asset_class, [parse_rule(rule) for rule in rules], version)
+        for asset_class, rules in spec.items()
+    }
+
+
+class ScoringRules:
+    """Загрузчик правил с горячей перезагрузкой по mtime"""
+    
+    def __init__(self, path: str = SCORING_RULES_PATH, check_interval: float = SCORING_RULES_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._scorers: Dict[str, CompiledScorer] = {}
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self.version = ''
+        self._reload()
+        if not self._scorers:
+            raise ValueError(f"Не удалось загрузить правила оценки из {path}")
+    
+    def scorer(self, asset_class: str) -> CompiledScorer:
+        """Актуальный скомпилированный набор правил для класса активов"""
+        self._maybe_reload()
+        try:
+            return self._scorers[asset_class]
+        except KeyError:
+            raise KeyError(f"Нет правил оценки для '{asset_class}'") from None
+    
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            self._reload()
+    
+    def _reload(self) -> None:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            print(f"⚠️ Файл правил оценки недоступен ({self.path}): {e}")
+            return
+        if mtime == self._mtime:
+            return
+        # Запоминаем mtime и при ошибке, чтобы не разбирать тот же файл на каждой проверке
+        self._mtime = mtime
+        try:
+            with open(self.path, 'rb') as f:
+                scorers = compile_rules(f.read())
+        except Exception as e:
+            # Ошибка в файле не должна ломать бота: продолжаем со старыми правилами
+            print(f"⚠️ Правила оценки не загружены ({self.path}): {e}")
+            return
+        
+        self._scorers = scorers
+        self.version = next(iter(scorers.values())).version if scorers else ''
+        print(f"📐 Правила оценки загружены: v{self.version}")
+
+
+_scoring_rules: Optional[ScoringRules] = None
+_scoring_rules_lock = threading.Lock()
+
+
+def get_scoring_rules() -> ScoringRules:
+    """Общие правила оценки процесса"""
+    global _scoring_rules
+    if _scoring_rules is None:
+        with _scoring_rules_lock:
+            if _scoring_rules is None:
+                _scoring_rules = ScoringRules()
+    return _scoring_rules
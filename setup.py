@@ -31,8 +31,8 @@ def check_dependencies():
         'python-telegram-bot',
         'requests',
         'python-dotenv',
-        'schedule',
-        'pytz'
+        'pytz',
+        'numpy'
     ]
     
     missing_packages = []
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Объединение одновременных одинаковых запросов (single-flight)
+Первый вызов с ключом выполняет работу, остальные ждут тот же Future.
+Future из concurrent.futures, поэтому его можно ждать и из потоков, и из любого event loop
+(asyncio.wrap_future): вебхук, polling и планировщик делят одну загрузку
+"""
+
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+    
+    def submit(self, key: Hashable, executor: Executor, fn: Callable[..., Any], *args: Any) -> Future:
+        """Запускает fn в executor или возвращает Future уже идущего вызова с тем же ключом"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = executor.submit(fn, *args)
+            self._inflight[key] = future
+            self.leaders += 1
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+    
+    def do(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Any:
+        """Синхронный вариант: ведущий вызов выполняется в текущем потоке, остальные ждут его"""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._forget(key, future)
+    
+    def _forget(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'leaders': self.leaders, 'coalesced': self.coalesced, 'in_flight': len(self._inflight)}
+
+
+_single_flight: Optional[SingleFlight] = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Общий реестр выполняющихся запросов процесса"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Фоновое обновление рыночных снимков
+Снимки обновляются заранее, до истечения TTL, чтобы сеть не попадала в обработку нажатий
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class SnapshotRefresher:
+    def __init__(self):
+        self.jobs: Dict[str, Dict] = {}
+        self.in_flight: Dict[str, threading.Thread] = {}
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, name: str, refresh_fn: Callable[[], object], interval: float) -> None:
+        """Регистрирует класс активов со своим интервалом обновления (первый запуск сразу)"""
+        with self.lock:
+            self.jobs[name] = {'fn': refresh_fn, 'interval': interval, 'next_run': time.monotonic()}
+        self._wakeup.set()
+
+    def trigger(self, name: str, refresh_fn: Callable[[], object]) -> bool:
+        """
+        Запускает обновление в фоне, если оно еще не идет.
+        Возвращает False, если обновление этого снимка уже выполняется
+        """
+        with self.lock:
+            running = self.in_flight.get(name)
+            if running is not None and running.is_alive():
+                return False
+            thread = threading.Thread(target=self._run, args=(name, refresh_fn),
+                                      name=f'refresh-{name}', daemon=True)
+            self.in_flight[name] = thread
+        thread.start()
+        return True
+
+    def _run(self, name: str, refresh_fn: Callable[[], object]) -> None:
+        started = time.monotonic()
+        try:
+            refresh_fn()
+            print(f"🔄 Снимок {name} обновлен за {time.monotonic() - started:.1f} с")
+        except Exception as e:
+            print(f"❌ Ошибка фонового обновления {name}: {e}")
+
+    def start(self) -> None:
+        """Запускает поток планирования (повторный вызов ничего не делает)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='snapshot-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            now = time.monotonic()
+            due: List[str] = []
+            with self.lock:
+                for name, job in self.jobs.items():
+                    if job['next_run'] <= now:
+                        due.append(name)
+                        job['next_run'] = now + job['interval']
+                next_run = min((job['next_run'] for job in self.jobs.values()), default=now + 60)
+                calls = [(name, self.jobs[name]['fn']) for name in due]
+
+            for name, refresh_fn in calls:
+                self.trigger(name, refresh_fn)
+
+            self._wakeup.wait(max(0.0, next_run - time.monotonic()))
+            self._wakeup.clear()
+
+
+_refresher: Optional[SnapshotRefresher] = None
+_refresher_lock = threading.Lock()
+
+
+def get_refresher() -> SnapshotRefresher:
+    """Возвращает общий планировщик обновлений процесса"""
+    global _refresher
+    if _refresher is None:
+        with _refresher_lock:
+            if _refresher is None:
+                _refresher = SnapshotRefresher()
+    return _refresher
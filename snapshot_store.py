@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Хранилище рыночных снимков на SQLite
+Публикация атомарна (одна транзакция), у каждого снимка монотонно растущая версия,
+читатели из разных процессов не блокируют друг друга (WAL)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+from config import SNAPSHOT_DB_PATH
+
+
+class SnapshotStore:
+    def __init__(self, db_path: str = SNAPSHOT_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Отдельное соединение на поток; схема создается при первом обращении"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS snapshots ('
+                'key TEXT PRIMARY KEY, version INTEGER NOT NULL, '
+                'published_at REAL NOT NULL, payload TEXT NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def publish(self, key: str, data: Any) -> int:
+        """Публикует новый снимок и возвращает его версию"""
+        payload = json.dumps(data)
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute("SELECT value FROM counters WHERE name = 'version'").fetchone()
+            version = (row[0] if row else 0) + 1
+            conn.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('version', ?)", (version,))
+            conn.execute(
+                'INSERT OR REPLACE INTO snapshots (key, version, published_at, payload) VALUES (?, ?, ?, ?)',
+                (key, version, time.time(), payload)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return version
+
+    def head(self, key: str) -> Optional[Tuple[int, float]]:
+        """Версия и время публикации снимка без чтения данных"""
+        row = self._connect().execute(
+            'SELECT version, published_at FROM snapshots WHERE key = ?', (key,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def load(self, key: str) -> Optional[Tuple[int, float, Any]]:
+        """Версия, время публикации и данные снимка"""
+        row = self._connect().execute(
+            'SELECT version, published_at, payload FROM snapshots WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+
+_store: Optional[SnapshotStore] = None
+_store_lock = threading.Lock()
+
+
+def get_snapshot_store() -> SnapshotStore:
+    """Общее хранилище снимков процесса"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SnapshotStore()
+    return _store
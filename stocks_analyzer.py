@@ -4,51 +4,64 @@
 Аналогично crypto_analyzer.py, но для акций
 """
 
-import requests
-import json
-import time
 import os
-import hashlib
-from typing import List, Dict, Any
-from config import MIN_MARKET_CAP, MIN_VOLUME_24H, MAX_PRICE_PER_COIN, DAILY_BUDGET
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from config import (MIN_MARKET_CAP, MIN_VOLUME_24H, MAX_PRICE_PER_COIN, DAILY_BUDGET,
+                    STOCKS_FETCH_WORKERS, STOCKS_BULK_CHUNK_SIZE,
+                    STOCKS_UNIVERSE_SIZE, STOCKS_REFRESH_INTERVAL)
+from asset_pipeline import AssetAnalyzer
+from http_client import get_provider_client
+from market_snapshot import MarketSnapshot, FLOAT, INT, TEXT
+from market_cache import get_market_cache
+from scoring_engine import column
+from tiered_selection import Tier, STRICT, RELAXED
 
-class StocksAnalyzer:
+# Колонки снимка в формате get_stock_info
+STOCK_FIELDS = [
+    ('symbol', lambda stock: stock.get('symbol'), TEXT),
+    ('name', lambda stock: stock.get('name'), TEXT),
+    ('current_price', lambda stock: stock.get('current_price'), FLOAT),
+    ('price_change_24h', lambda stock: stock.get('price_change_24h'), FLOAT),
+    ('price_change_7d', lambda stock: stock.get('price_change_7d'), FLOAT),
+    ('market_cap', lambda stock: stock.get('market_cap'), FLOAT),
+    ('volume_24h', lambda stock: stock.get('volume_24h'), FLOAT),
+    ('market_cap_rank', lambda stock: stock.get('market_cap_rank'), INT),
+    ('image', lambda stock: stock.get('image'), TEXT),
+]
+
+class StocksAnalyzer(AssetAnalyzer):
+    asset_class = 'stocks'
+    fields = STOCK_FIELDS
+    universe_size = STOCKS_UNIVERSE_SIZE
+    title = ' по акциям'
+    items_label = 'акций'
+    suitable_label = 'акций'
+    snapshot_prefix = 'stocks'
+    refresh_interval = STOCKS_REFRESH_INTERVAL
+    
     def __init__(self):
+        super().__init__()
         # Используем Alpha Vantage API (бесплатный, до 5 запросов/минуту)
         # Или можно использовать Yahoo Finance API
         self.base_url = "https://query1.finance.yahoo.com/v8/finance/chart"
+        # Пакетные котировки: много тикеров за один запрос
+        self.quote_url = "https://query1.finance.yahoo.com/v7/finance/quote"
         self.alpha_vantage_key = os.getenv('ALPHA_VANTAGE_API_KEY', '')
+        # Общий клиент с keep-alive пулами соединений
+        self.http = get_provider_client()
+        # Кеш снимков: память процесса поверх файлов в /tmp
+        self.cache = get_market_cache('stocks')
         
-    def _cache_path(self, key: str) -> str:
-        """Путь к кешу"""
-        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
-        return os.path.join('/tmp', f'stocks_cache_{digest}.json')
-    
-    def _read_cache(self, key: str, ttl_seconds: int = 900) -> List[Dict[str, Any]]:
-        """Читает кеш"""
-        try:
-            path = self._cache_path(key)
-            if not os.path.exists(path):
-                return []
-            if time.time() - os.path.getmtime(path) > ttl_seconds:
-                return []
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            return []
-    
-    def _write_cache(self, key: str, data: List[Dict[str, Any]]) -> None:
-        """Записывает в кеш"""
-        try:
-            path = self._cache_path(key)
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(data, f)
-        except Exception:
-            pass
-    
     def get_top_stocks(self, limit: int = 50) -> List[Dict[str, Any]]:
         """
         Получает топ акций
+        """
+        return self.get_snapshot(limit)[1]
+    
+    def fetch_universe(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Загружает котировки у провайдера
         Используем список популярных акций для анализа
         """
         # Популярные акции для анализа
@@ -61,21 +74,80 @@ class StocksAnalyzer:
             'LOW', 'RTX', 'UNH', 'INTU', 'DE', 'UBER', 'SPOT', 'ROKU'
         ][:limit]
         
-        stocks_data = []
-        
-        for symbol in popular_stocks:
+        # Сначала пакетные котировки: несколько запросов вместо одного на тикер
+        quotes = self.get_bulk_quotes(popular_stocks)
+        
+        # Тикеры, которые пакетный эндпоинт не вернул, догружаем поштучно и параллельно;
+        # частоту запросов ограничивает общий HTTP-клиент, а executor.map сохраняет порядок
+        missing = [symbol for symbol in popular_stocks if symbol not in quotes]
+        if missing and self.http.is_open(self.base_url):
+            print("Yahoo Finance временно отключен, поштучная загрузка пропущена")
+        elif missing:
+            print(f"Пакетный запрос не вернул {len(missing)} тикеров, загружаем поштучно...")
+            workers = max(1, min(STOCKS_FETCH_WORKERS, len(missing)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stocks-fetch') as executor:
+                for symbol, stock_info in zip(missing, executor.map(self._fetch_stock_safe, missing)):
+                    if stock_info:
+                        quotes[symbol] = stock_info
+        
+        return [quotes[symbol] for symbol in popular_stocks if symbol in quotes]
+    
+    def get_bulk_quotes(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Получает котировки пачками по STOCKS_BULK_CHUNK_SIZE тикеров"""
+        quotes: Dict[str, Dict[str, Any]] = {}
+        for start in range(0, len(symbols), STOCKS_BULK_CHUNK_SIZE):
+            chunk = symbols[start:start + STOCKS_BULK_CHUNK_SIZE]
+            quotes.update(self._fetch_quote_chunk(chunk))
+        return quotes
+    
+    def _fetch_quote_chunk(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Один запрос к пакетному эндпоинту; при ошибке возвращает пустой результат"""
+        try:
+            response = self.http.get(self.quote_url, params={'symbols': ','.join(symbols)})
+            if response.status_code != 200:
+                print(f"Yahoo quote HTTP {response.status_code}")
+                return {}
+            rows = response.json().get('quoteResponse', {}).get('result') or []
+        except Exception as e:
+            print(f"Ошибка пакетного запроса котировок: {e}")
+            return {}
+        
+        requested = set(symbols)
+        quotes = {}
+        for row in rows:
+            symbol = row.get('symbol')
+            if symbol not in requested or row.get('regularMarketPrice') is None:
+                continue
             try:
-                stock_info = self.get_stock_info(symbol)
-                if stock_info:
-                    stocks_data.append(stock_info)
-                time.sleep(0.2)  # Пауза между запросами
-            except Exception as e:
-                print(f"Ошибка при получении данных для {symbol}: {e}")
+                quotes[symbol] = self._quote_to_stock(row)
+            except (ValueError, TypeError):
                 continue
-        
-        return stocks_data
+        return quotes
+    
+    def _quote_to_stock(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Приводит строку пакетной котировки к формату get_stock_info"""
+        symbol = row['symbol']
+        return {
+            'symbol': symbol,
+            'name': row.get('longName') or row.get('shortName') or symbol,
+            'current_price': float(row['regularMarketPrice']),
+            'price_change_24h': float(row.get('regularMarketChangePercent') or 0),
+            'price_change_7d': 0,  # Будет рассчитано позже
+            'market_cap': row.get('marketCap', 0),
+            'volume_24h': row.get('regularMarketVolume', 0),
+            'market_cap_rank': 0,  # Для акций не используется
+            'image': f"https://logo.clearbit.com/{row.get('exchange', 'NYSE')}.com"
+        }
+    
+    def _fetch_stock_safe(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Загружает одну акцию; ошибка по тикеру не влияет на остальные"""
+        try:
+            return self.get_stock_info(symbol)
+        except Exception as e:
+            print(f"Ошибка при получении данных для {symbol}: {e}")
+            return None
     
-    def get_stock_info(self, symbol: str) -> Dict[str, Any]:
+    def get_stock_info(self, symbol: str) -> Optional[Dict[str, Any]]:
         """Получает информацию об акции"""
         try:
             # Используем Yahoo Finance API (не требует ключа)
@@ -85,7 +157,7 @@ class StocksAnalyzer:
                 'range': '5d'
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self.http.get(url, params=params)
             if response.status_code == 200:
                 data = response.json()
                 result = data.get('chart', {}).get('result', [])
@@ -117,98 +189,20 @@ class StocksAnalyzer:
     
     def filter_suitable_stocks(self, stocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Фильтрует акции по критериям"""
-        suitable = []
-        
-        for stock in stocks:
-            try:
-                price = stock.get('current_price', 0)
-                market_cap = stock.get('market_cap', 0)
-                volume = stock.get('volume_24h', 0)
-                
-                # Критерии: цена до $10, достаточная капитализация и объем
-                if (price <= MAX_PRICE_PER_COIN and 
-                    price > 0.01 and
-                    market_cap >= MIN_MARKET_CAP and
-                    volume >= MIN_VOLUME_24H):
-                    
-                    suitable.append(stock)
-            except Exception:
-                continue
-        
-        # Если подходящих акций мало, ослабляем критерии
-        if len(suitable) < 3:
-            suitable = []
-            for stock in stocks:
-                try:
-                    price = stock.get('current_price', 0)
-                    volume = stock.get('volume_24h', 0)
-                    
-                    if (price <= 10.0 and 
-                        price > 0.01 and
-                        volume >= 5000000):
-                        suitable.append(stock)
-                except Exception:
-                    continue
-            
-            suitable.sort(key=lambda x: x.get('market_cap', 0), reverse=True)
-        
-        return suitable
+        return self.filter_records(stocks)
     
-    def calculate_investment_score(self, stock: Dict[str, Any]) -> float:
-        """Рассчитывает оценку привлекательности"""
-        score = 0.0
-        
-        price = stock.get('current_price', 0)
-        if price > 0:
-            price_score = max(0, 10 - price)
-            score += price_score * 0.3
-        
-        volume = stock.get('volume_24h', 0)
-        if volume > 0:
-            volume_score = min(10, volume / 10000000)
-            score += volume_score * 0.2
-        
-        market_cap = stock.get('market_cap', 0)
-        if market_cap > 0:
-            if 1000000000 <= market_cap <= 100000000000:  # 1B - 100B
-                market_cap_score = 10
-            else:
-                market_cap_score = 7
-            score += market_cap_score * 0.2
-        
-        price_change = stock.get('price_change_24h', 0)
-        if -20 <= price_change <= 10:
-            price_change_score = 10
-        elif price_change < -20:
-            price_change_score = 5
-        else:
-            price_change_score = 3
-        score += price_change_score * 0.3
-        
-        return score
+    def selection_tiers(self, snapshot: MarketSnapshot) -> List[Tier]:
+        """Маски уровней отбора по колонкам снимка"""
+        price = column(snapshot, 'current_price')
+        market_cap = column(snapshot, 'market_cap')
+        volume = column(snapshot, 'volume_24h')
+        return [
+            # Критерии: цена до $10, достаточная капитализация и объем
+            Tier(STRICT, (price > 0.01) & (price <= MAX_PRICE_PER_COIN) &
+                 (market_cap >= MIN_MARKET_CAP) & (volume >= MIN_VOLUME_24H), min_count=3),
+            # Если подходящих акций мало, ослабляем критерии; крупные компании первыми
+            Tier(RELAXED, (price > 0.01) & (price <= 10.0) & (volume >= 5000000), order=[-market_cap]),
+        ]
     
-    def get_top_3_recommendations(self) -> List[Dict[str, Any]]:
-        """Получает топ-3 рекомендации по акциям"""
-        print("🚀 Начинаем получение рекомендаций по акциям...")
-        
-        stocks = self.get_top_stocks(limit=30)
-        print(f"📊 Получено {len(stocks) if stocks else 0} акций")
-        
-        suitable = self.filter_suitable_stocks(stocks)
-        print(f"✅ Найдено {len(suitable) if suitable else 0} подходящих акций")
-        
-        if not suitable:
-            return []
-        
-        # Рассчитываем оценки
-        for stock in suitable:
-            stock['investment_score'] = self.calculate_investment_score(stock)
-        
-        # Сортируем по оценке
-        suitable.sort(key=lambda x: x.get('investment_score', 0), reverse=True)
-        
-        # Возвращаем топ-3
-        result = suitable[:3]
-        print(f"🏆 Возвращаем {len(result)} рекомендаций")
-        return result
-
+    def memo_params(self) -> Tuple[Any, ...]:
+        return (STOCKS_UNIVERSE_SIZE, MIN_MARKET_CAP, MIN_VOLUME_24H, MAX_PRICE_PER_COIN)
@@ -5,7 +5,10 @@
 """
 
 import asyncio
-from crypto_analyzer import CryptoAnalyzer
+from crypto_analyzer import CryptoAnalyzer, CRYPTO_FIELDS
+from stocks_analyzer import StocksAnalyzer, STOCK_FIELDS
+from bonds_analyzer import BondsAnalyzer, BOND_FIELDS
+from market_snapshot import MarketSnapshot
 from config import TELEGRAM_BOT_TOKEN, CHAT_ID
 
 async def test_analysis():
@@ -43,6 +46,274 @@ async def test_analysis():
     except Exception as e:
         print(f"❌ Ошибка при тестировании: {e}")
 
+def test_scoring_parity():
+    """
+    Проверяет, что векторная оценка совпадает со скалярной calculate_investment_score,
+    а правила из scoring_rules.json дают эталонные значения прежних формул
+    """
+    print("🧮 Проверка векторной оценки...")
+    
+    # Граничные значения всех кусочных правил
+    prices = [-1, 0, 0.005, 0.5, 9.99, 10, 12]
+    volumes = [0, 5000000, 100000000, 500000000]
+    market_caps = [0, 9999999, 10000000, 1000000000, 1000000001, 100000000000, 200000000000]
+    changes = [-25, -20, 0, 10, 10.5]
+    rows = [
+        {'symbol': f'T{n}', 'name': f'Test {n}', 'current_price': p, 'total_volume': v,
+         'volume_24h': v, 'market_cap': m, 'price_change_percentage_24h': c, 'price_change_24h': c}
+        for n, (p, v, m, c) in enumerate(
+            (p, v, m, c) for p in prices for v in volumes for m in market_caps for c in changes)
+    ]
+    bonds = [
+        {'symbol': f'B{n}', 'current_price': price, 'yield': y, 'volume_24h': v, 'rating': r}
+        for n, (price, y, v, r) in enumerate(
+            (price, y, v, r) for price in [90, 95, 97, 99, 100, 101.5]
+            for y in [2.5, 3.0, 4.0, 5.0] for v in [50000000, 100000000, 200000000, 500000000]
+            for r in ['AAA', 'AA-', 'A+', 'BBB', 'BB', ''])
+    ]
+    # Облигации без цены: правило цены считает ее номиналом
+    bonds += [
+        {'symbol': f'BN{n}', 'yield': y, 'volume_24h': v, 'rating': 'AA-'}
+        for n, (y, v) in enumerate((y, v) for y in [3.0, 5.0] for v in [100000000, 500000000])
+    ]
+    
+    cases = [
+        (CryptoAnalyzer(), 'crypto', CRYPTO_FIELDS, rows),
+        (StocksAnalyzer(), 'stocks', STOCK_FIELDS, rows),
+        (BondsAnalyzer(), 'bonds', BOND_FIELDS, bonds),
+    ]
+    for analyzer, asset_class, fields, records in cases:
+        score = analyzer.rules.scorer(asset_class).score_snapshot
+        snapshot = MarketSnapshot.from_records(records, fields)
+        vectorized = score(snapshot).tolist()
+        scalar = [analyzer.calculate_investment_score(snapshot.view(i)) for i in snapshot.indices()]
+        assert vectorized == scalar, f"{type(analyzer).__name__}: оценки расходятся"
+        
+        # Выборка по индексам должна давать те же значения
+        subset = list(range(0, len(snapshot), 7))
+        assert score(snapshot, subset).tolist() == [scalar[i] for i in subset]
+    
+    # Эталонные оценки прежних формул calculate_investment_score
+    market = [
+        {'current_price': 0.45, 'volume_24h': 300000000, 'market_cap': 16000000000, 'price_change_24h': 1.5},
+        {'current_price': 0.02, 'volume_24h': 2500000, 'market_cap': 5000000, 'price_change_24h': -35},
+        {'current_price': 3.2, 'volume_24h': 45000000, 'market_cap': 400000000, 'price_change_24h': 18},
+    ]
+    golden_bonds = [
+        {'current_price': 100.0, 'yield': 4.5, 'volume_24h': 1000000000, 'rating': 'AAA'},
+        {'current_price': 97.5, 'yield': 3.2, 'volume_24h': 150000000, 'rating': 'BBB+'},
+        {'current_price': 93.0, 'yield': 5.6, 'volume_24h': 50000000, 'rating': 'BB'},
+        {'yield': 4.5, 'volume_24h': 1000000000, 'rating': 'AAA'},
+    ]
+    golden = [
+        (CryptoAnalyzer(), market, [9.265, 5.5440000000000005, 5.84]),
+        (StocksAnalyzer(), market, [9.865, 5.944, 5.24]),
+        (BondsAnalyzer(), golden_bonds, [9.2, 6.2, 6.4, 9.2]),
+    ]
+    for analyzer, records, expected in golden:
+        actual = [analyzer.calculate_investment_score(record) for record in records]
+        assert actual == expected, f"{type(analyzer).__name__}: {actual} != {expected}"
+    
+    print("✅ Векторная оценка совпадает со скалярной")
+
+def test_rules_reload_rerenders():
+    """
+    Перезагрузка правил оценки меняет текст сообщения при той же версии снимка
+    """
+    import json
+    import os
+    import tempfile
+    from datetime import datetime
+    from message_renderer import get_renderer, INTERACTIVE
+    from scoring_rules import ScoringRules, SCORING_RULES_PATH
+    
+    with open(SCORING_RULES_PATH, encoding='utf-8') as f:
+        config = json.load(f)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'scoring_rules.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+        
+        analyzer = BondsAnalyzer()
+        analyzer.rules = ScoringRules(path, check_interval=0)
+        now = datetime(2024, 1, 15, 9, 0)
+        renderer = get_renderer()
+        
+        version, before = analyzer.get_versioned_recommendations()
+        text_before = renderer.render('bonds', INTERACTIVE, version, before, now).text
+        
+        # Оцениваем только по доходности — вперед выходят корпоративные облигации
+        for rule in config['bonds']:
+            rule['weight'] = 1.0 if rule['field'] == 'yield' else 0.0
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+        mtime = os.path.getmtime(path) + 10
+        os.utime(path, (mtime, mtime))
+        
+        version_after, after = analyzer.get_versioned_recommendations()
+        text_after = renderer.render('bonds', INTERACTIVE, version_after, after, now).text
+    
+    assert version_after == version
+    assert after != before
+    assert text_after != text_before
+    
+    print("✅ Перезагрузка правил меняет текст рекомендаций")
+
+def test_scheduler_dst():
+    """
+    Проверяет расчет ежедневных запусков на границах перехода на летнее и зимнее время
+    """
+    import pytz
+    from datetime import datetime
+    from async_scheduler import next_daily_run, previous_daily_run
+    
+    print("🕰 Проверка планировщика на переходах времени...")
+    
+    berlin = pytz.timezone("Europe/Berlin")
+    ts = lambda *args: berlin.localize(datetime(*args)).timestamp()
+    local = lambda value: datetime.fromtimestamp(value, berlin).strftime('%Y-%m-%d %H:%M')
+    
+    # (время запуска, момент "сейчас", ожидаемый предыдущий, ожидаемый следующий)
+    cases = [
+        ('23:00', ts(2026, 3, 29, 1, 0), '2026-03-28 23:00', '2026-03-29 23:00'),   # короткие сутки
+        ('10:00', ts(2026, 3, 29, 12, 0), '2026-03-29 10:00', '2026-03-30 10:00'),
+        ('10:00', ts(2026, 3, 29, 9, 0), '2026-03-28 10:00', '2026-03-29 10:00'),
+        ('23:00', ts(2026, 10, 25, 1, 0), '2026-10-24 23:00', '2026-10-25 23:00'),  # длинные сутки
+        ('10:00', ts(2026, 10, 25, 12, 0), '2026-10-25 10:00', '2026-10-26 10:00'),
+        ('10:00', ts(2026, 10, 25, 10, 0), '2026-10-25 10:00', '2026-10-26 10:00'),  # ровно в момент запуска
+    ]
+    for at, now, previous, following in cases:
+        assert local(previous_daily_run(at, berlin, now)) == previous, (at, local(now))
+        assert local(next_daily_run(at, berlin, now)) == following, (at, local(now))
+    
+    print("✅ Запуски на переходах времени рассчитаны верно")
+
+class FakeBroadcastBot:
+    """Бот-заглушка для рассылки: блокировки, лимит Telegram, таймаут и падение процесса"""
+    
+    def __init__(self, blocked=(), retry_after=(), timed_out=(), crash_at=None):
+        self.sent = []
+        self.blocked = set(blocked)
+        self.retry_after = set(retry_after)
+        self.timed_out = set(timed_out)
+        self.crash_at = crash_at
+    
+    async def send_message(self, chat_id, text, **kwargs):
+        from telegram.error import Forbidden, RetryAfter, TimedOut
+        
+        await asyncio.sleep(0)
+        if chat_id in self.blocked:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        if chat_id in self.retry_after:
+            self.retry_after.discard(chat_id)
+            raise RetryAfter(1)
+        if chat_id in self.timed_out:
+            raise TimedOut()
+        if self.crash_at is not None and (chat_id, text) == self.crash_at:
+            raise RuntimeError("процесс остановлен")
+        self.sent.append((chat_id, text))
+
+async def check_broadcast():
+    """
+    Проверяет рассылку: RetryAfter, отключение заблокировавших бота и продолжение после падения
+    """
+    import os
+    import tempfile
+    import pytz
+    from broadcast import Broadcaster, SubscriberRegistry, manual_broadcast_id, scheduled_broadcast_id
+    
+    print("📨 Проверка рассылки подписчикам...")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        registry = SubscriberRegistry(os.path.join(directory, 'broadcast.sqlite3'))
+        for chat_id in range(1, 41):
+            registry.subscribe(chat_id)
+        # Имя канала в CHAT_ID не ломает реестр
+        registry.seed('@channelname')
+        assert registry.stats() == {'subscribers': 40, 'active': 40}
+        
+        # Плановая рассылка и ее догоняющий запуск имеют один id, ручная — всегда новый
+        moscow = pytz.timezone('Europe/Moscow')
+        assert scheduled_broadcast_id('daily', 1792220400, moscow) == scheduled_broadcast_id('daily', 1792220400, moscow)
+        assert manual_broadcast_id('crypto') != scheduled_broadcast_id('daily', 1792220400, moscow)
+        parts = ['часть 1', 'часть 2']
+        options = dict(concurrency=5, rate=1000, chat_interval=0)
+        
+        # Падение на второй части для чата 20: первая часть уже ушла
+        bot = FakeBroadcastBot(blocked={7}, retry_after={3}, timed_out={11}, crash_at=(20, 'часть 2'))
+        try:
+            await Broadcaster(bot, registry, **options).broadcast('daily-test', parts)
+            assert False, "рассылка должна была упасть"
+        except RuntimeError:
+            pass
+        first_run = list(bot.sent)
+        assert (20, 'часть 1') in first_run
+        assert not registry.is_active(7), "заблокировавший бота чат должен быть отключен"
+        
+        # Повторный запуск продолжает с места остановки и не повторяет отправленное
+        bot = FakeBroadcastBot()
+        report = await Broadcaster(bot, registry, **options).broadcast('daily-test', parts)
+        delivered = first_run + bot.sent
+        assert len(delivered) == len(set(delivered)), "после рестарта части не должны уходить повторно"
+        assert (20, 'часть 2') in bot.sent and (20, 'часть 1') not in bot.sent
+        assert not any(chat_id == 11 for chat_id, _ in delivered), "после таймаута чат не должен получить повтор"
+        expected = {(chat_id, text) for chat_id in range(1, 41) if chat_id not in (7, 11) for text in parts}
+        assert set(delivered) == expected
+        assert (3, 'часть 1') in delivered, "после RetryAfter сообщение должно уйти"
+        assert report.resumed > 0
+        
+        # Завершенная рассылка больше ничего не отправляет
+        bot = FakeBroadcastBot()
+        report = await Broadcaster(bot, registry, **options).broadcast('daily-test', parts)
+        assert not bot.sent and report.messages == 0
+    
+    print("✅ Рассылка продолжается после падения без повторов")
+
+def test_broadcast():
+    asyncio.run(check_broadcast())
+
+async def check_update_dispatch():
+    """
+    Чат, заваливший очередь обновлениями, не задерживает остальные чаты
+    """
+    from datetime import datetime
+    from telegram import Chat, Message, Update
+    from update_processor import ChatOrderedUpdateProcessor, dispatch_updates
+    
+    def make_update(update_id, chat_id):
+        chat = Chat(chat_id, Chat.PRIVATE)
+        return Update(update_id, message=Message(update_id, datetime(2024, 1, 15), chat))
+    
+    handled = []
+    
+    async def handle(update):
+        await asyncio.sleep(0.01)
+        handled.append((update.effective_chat.id, update.update_id))
+    
+    processor = ChatOrderedUpdateProcessor(max_concurrent_updates=2, max_pending_updates=100)
+    await processor.initialize()
+    queue = asyncio.Queue()
+    for update_id in range(1, 31):
+        queue.put_nowait(make_update(update_id, 42))
+    queue.put_nowait(make_update(31, 7))
+    
+    dispatcher = asyncio.create_task(dispatch_updates(queue, processor, handle, max_pending=100))
+    await asyncio.wait_for(queue.join(), timeout=5)
+    dispatcher.cancel()
+    await asyncio.gather(dispatcher, return_exceptions=True)
+    
+    # Обновление второго чата обработано сразу, а не после всей очереди первого
+    assert handled.index((7, 31)) < 3, handled
+    # Внутри чата порядок сохранен
+    assert [update_id for chat_id, update_id in handled if chat_id == 42] == list(range(1, 31))
+    assert processor.stats()['active_chats'] == 0
+    
+    print("✅ Очередь одного чата не задерживает другие чаты")
+
+def test_update_dispatch():
+    asyncio.run(check_update_dispatch())
+
 async def test_telegram_send():
     """
     Тестирует отправку сообщения в Telegram
@@ -88,6 +359,15 @@ async def main():
     
     print("\n" + "="*60 + "\n")
     
+    # Тест векторной оценки
+    test_scoring_parity()
+    test_rules_reload_rerenders()
+    test_scheduler_dst()
+    await check_broadcast()
+    await check_update_dispatch()
+    
+    print("\n" + "="*60 + "\n")
+    
     # Тест Telegram
     await test_telegram_send()
     
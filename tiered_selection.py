@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Выбор топ-k по уровням критериев (строгие, ослабленные, резервные)
+Маски всех уровней считаются по колонкам снимка за один проход, затем берется
+первый уровень с достаточным числом кандидатов и из него частичным отбором
+выбираются k лучших без полной сортировки
+"""
+
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+import numpy as np
+
+STRICT = 'strict'
+RELAXED = 'relaxed'
+FALLBACK = 'fallback'
+
+
+class Tier(NamedTuple):
+    name: str
+    mask: np.ndarray
+    # Уровень принимается, если кандидатов не меньше min_count
+    min_count: int = 1
+    # Ключи порядка внутри уровня (по возрастанию); при равенстве — исходный порядок
+    order: Sequence[np.ndarray] = ()
+    # Для нескоринговых уровней оценка равна 0 и порядок задают только order
+    scored: bool = True
+
+
+class TieredSelection(NamedTuple):
+    tier: Optional[str]
+    candidates: np.ndarray
+    selected: np.ndarray
+    scores: np.ndarray
+    counts: Dict[str, int]
+
+
+def top_k(keys: Sequence[np.ndarray], k: int) -> np.ndarray:
+    """
+    Позиции k наименьших элементов по ключам (первый — главный),
+    ничьи разрешаются следующими ключами и затем позицией
+    """
+    size = len(keys[0])
+    positions = np.arange(size)
+    if size > k > 0:
+        # Частичный отбор: оставляем только тех, кто не хуже k-го по главному ключу
+        kth = np.partition(keys[0], k - 1)[k - 1]
+        positions = np.flatnonzero(keys[0] <= kth)
+    # lexsort сортирует по последнему ключу как главному
+    order = np.lexsort([positions] + [key[positions] for key in reversed(keys)])
+    return positions[order][:k]
+
+
+def ordered(tier: Tier) -> np.ndarray:
+    """Все кандидаты уровня в порядке order"""
+    candidates = np.flatnonzero(tier.mask)
+    if not tier.order:
+        return candidates
+    return candidates[np.lexsort([key[candidates] for key in reversed(tier.order)])]
+
+
+def first_tier(tiers: Sequence[Tier]) -> Optional[Tier]:
+    """Первый уровень, набравший min_count кандидатов"""
+    for tier in tiers:
+        if np.count_nonzero(tier.mask) >= tier.min_count:
+            return tier
+    return None
+
+
+def select_tiered(tiers: Sequence[Tier], k: int,
+                  score: Callable[[np.ndarray], np.ndarray]) -> TieredSelection:
+    """
+    Выбирает top-k из первого подходящего уровня
+    score получает индексы кандидатов и возвращает их оценки
+    """
+    counts = {tier.name: int(np.count_nonzero(tier.mask)) for tier in tiers}
+    empty = np.zeros(0, dtype=np.intp)
+    tier = first_tier(tiers)
+    if tier is None:
+        return TieredSelection(None, empty, empty, np.zeros(0), counts)
+    
+    candidates = np.flatnonzero(tier.mask)
+    order_keys: List[np.ndarray] = [key[candidates] for key in tier.order]
+    if tier.scored:
+        scores = np.asarray(score(candidates), dtype=np.float64)
+        # Оценка по убыванию, при равенстве — порядок уровня
+        keys = [-scores] + order_keys
+    else:
+        scores = np.zeros(len(candidates))
+        keys = order_keys or [scores]
+    
+    positions = top_k(keys, k)
+    return TieredSelection(tier.name, candidates, candidates[positions], scores[positions], counts)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Отсев повторно доставленных обновлений Telegram по update_id
+Окно в памяти процесса отвечает за O(1) для частых повторов, таблица в хранилище
+снимков (SQLite) — общая для всех воркеров, и повтор, пришедший в другой процесс, тоже отсеивается
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from telegram import Update
+from telegram.ext import Application, ApplicationHandlerStop, ContextTypes, TypeHandler
+from config import SNAPSHOT_DB_PATH, UPDATE_DEDUP_WINDOW, UPDATE_DEDUP_MAX_ENTRIES
+
+# Как часто удалять из таблицы записи старше окна, сек
+PRUNE_INTERVAL = 60
+
+
+class UpdateDeduplicator:
+    def __init__(self, db_path: str = SNAPSHOT_DB_PATH, window: float = UPDATE_DEDUP_WINDOW,
+                 max_entries: int = UPDATE_DEDUP_MAX_ENTRIES):
+        self.db_path = db_path
+        self.window = window
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._seen: 'OrderedDict[int, float]' = OrderedDict()
+        self._pruned_at = 0.0
+        self._disabled = False
+        self.accepted = 0
+        self.duplicates = 0
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Отдельное соединение на поток; схема создается при первом обращении"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY, seen_at REAL NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+    
+    def seen(self, update_id: int) -> bool:
+        """Отмечает update_id как полученный; True — это повтор, обновление нужно пропустить"""
+        now = time.time()
+        if self._seen_recently(update_id, now):
+            return True
+        return self._finish(update_id, self._claim(update_id, now))
+    
+    async def aseen(self, update_id: int) -> bool:
+        """seen для event loop: окно в памяти проверяется сразу, SQLite — в потоке"""
+        now = time.time()
+        if self._seen_recently(update_id, now):
+            return True
+        return self._finish(update_id, await asyncio.to_thread(self._claim, update_id, now))
+    
+    def _seen_recently(self, update_id: int, now: float) -> bool:
+        """Проверка окна в памяти; новый update_id сразу запоминается"""
+        with self._lock:
+            seen_at = self._seen.get(update_id)
+            if seen_at is not None and now - seen_at < self.window:
+                self.duplicates += 1
+                return True
+            self._remember(update_id, now)
+        return False
+    
+    def _finish(self, update_id: int, claimed: bool) -> bool:
+        with self._lock:
+            if not claimed:
+                self.duplicates += 1
+                return True
+            self.accepted += 1
+        return False
+    
+    def forget(self, update_id: int) -> None:
+        """Снимает отметку, если обновление не удалось принять (его доставят снова)"""
+        with self._lock:
+            self._seen.pop(update_id, None)
+        if self._disabled:
+            return
+        try:
+            self._connect().execute('DELETE FROM seen_updates WHERE update_id = ?', (update_id,))
+        except sqlite3.Error as e:
+            print(f"Не удалось снять отметку обновления {update_id}: {e}")
+    
+    async def aforget(self, update_id: int) -> None:
+        """forget для event loop"""
+        await asyncio.to_thread(self.forget, update_id)
+    
+    def _remember(self, update_id: int, now: float) -> None:
+        self._seen[update_id] = now
+        self._seen.move_to_end(update_id)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+    
+    def _claim(self, update_id: int, now: float) -> bool:
+        """Атомарно занимает update_id в общей таблице; False — его уже принял другой процесс"""
+        if self._disabled:
+            return True
+        try:
+            conn = self._connect()
+            if now - self._pruned_at >= PRUNE_INTERVAL:
+                self._pruned_at = now
+                conn.execute('DELETE FROM seen_updates WHERE seen_at < ?', (now - self.window,))
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO seen_updates (update_id, seen_at) VALUES (?, ?)', (update_id, now)
+            )
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            # Без общего хранилища остается окно в памяти процесса
+            print(f"Хранилище update_id недоступно, отсеиваем повторы только в памяти: {e}")
+            self._disabled = True
+            return True
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'accepted': self.accepted, 'duplicates': self.duplicates, 'window_entries': len(self._seen)}
+
+
+_deduplicator: Optional[UpdateDeduplicator] = None
+_deduplicator_lock = threading.Lock()
+
+
+def get_update_deduplicator() -> UpdateDeduplicator:
+    """Общий фильтр повторов процесса"""
+    global _deduplicator
+    if _deduplicator is None:
+        with _deduplicator_lock:
+            if _deduplicator is None:
+                _deduplicator = UpdateDeduplicator()
+    return _deduplicator
+
+
+async def drop_duplicate_update(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик группы -1 для polling: повтор останавливает дальнейшую обработку"""
+    if isinstance(update, Update) and await get_update_deduplicator().aseen(update.update_id):
+        print(f"♻️ Повтор обновления {update.update_id} пропущен")
+        raise ApplicationHandlerStop
+
+
+def add_dedup_handler(application: Application) -> None:
+    """Подключает отсев повторов до всех остальных обработчиков"""
+    application.add_handler(TypeHandler(Update, drop_duplicate_update), group=-1)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Параллельная обработка обновлений Telegram с сохранением порядка внутри чата
+Разные чаты обрабатываются одновременно (до POLLING_CONCURRENCY), обновления одного чата —
+строго по очереди, чтобы нажатия "Назад" и "Криптовалюты" одного пользователя не гонялись
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from config import POLLING_CONCURRENCY, POLLING_MAX_PENDING
+
+
+def ordering_key(update: object) -> Optional[Hashable]:
+    """Ключ очереди: чат, а без чата (inline-запросы) — пользователь"""
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return ('chat', update.effective_chat.id)
+        if update.effective_user is not None:
+            return ('user', update.effective_user.id)
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Семафор базового класса ограничивает число ожидающих обновлений (POLLING_MAX_PENDING),
+    а реальная параллельность ограничивается внутри, уже после блокировки чата: обновления,
+    ждущие свой чат, не занимают слоты и не тормозят остальных пользователей
+    """
+    
+    def __init__(self, max_concurrent_updates: int = POLLING_CONCURRENCY,
+                 max_pending_updates: int = POLLING_MAX_PENDING):
+        super().__init__(max(max_concurrent_updates, max_pending_updates))
+        self.concurrency = max_concurrent_updates
+        self._limit: Optional[asyncio.Semaphore] = None
+        # Ключ -> [блокировка, число обновлений чата в обработке и ожидании]
+        self._chats: Dict[Hashable, list] = {}
+    
+    async def initialize(self) -> None:
+        # Семафор создается внутри работающего loop
+        self._limit = asyncio.Semaphore(self.concurrency)
+    
+    async def shutdown(self) -> None:
+        self._chats.clear()
+    
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if self._limit is None:
+            await self.initialize()
+        key = ordering_key(update)
+        if key is None:
+            async with self._limit:
+                await coroutine
+            return
+        
+        # Блокировки asyncio будят ожидающих в порядке очереди: обновления чата идут в порядке поступления
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._limit:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chats[key]
+    
+    def stats(self) -> Dict[str, int]:
+        return {'concurrency': self.concurrency, 'active_chats': len(self._chats)}
+
+
+async def dispatch_updates(queue: asyncio.Queue, processor: BaseUpdateProcessor,
+                           handle: Callable[[object], Awaitable[Any]],
+                           max_pending: int = POLLING_MAX_PENDING) -> None:
+    """
+    Раздает обновления из очереди: каждое обрабатывается отдельной задачей через processor.
+    Обновление, ждущее блокировку своего чата, не занимает обработчик, поэтому чат с длинной
+    очередью не задерживает остальных. Задач не больше max_pending — дальше обновления копятся
+    в очереди, а при ее переполнении webhook отвечает 503
+    """
+    pending = asyncio.Semaphore(max_pending)
+    tasks: Set[asyncio.Task] = set()
+    
+    async def run(update: object) -> None:
+        try:
+            await processor.process_update(update, handle(update))
+        except Exception as e:
+            print(f"❌ Ошибка обработки обновления {getattr(update, 'update_id', '?')}: {e}")
+        finally:
+            pending.release()
+            queue.task_done()
+    
+    try:
+        while True:
+            await pending.acquire()
+            update = await queue.get()
+            task = asyncio.create_task(run(update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)